@@ -1,10 +1,12 @@
 from copy import deepcopy
+from functools import partial
 
 import numpy as np
 
 from pacman.BenioPacmanFunctionValueApproximation import BenioPacmanFunctionValueApproximation
 from pacman.Ghost import Ghosts
 from pacman.Pacman import RandomPacman
+from pacman.Tournament import run_tournament, print_ranking
 from pacman.Game import Game
 
 board = ["*   g",
@@ -79,9 +81,17 @@ def test(n_games=10):
             print(f"{pacman.__class__.__name__}: {value}", end="\t")
         print()
 
-    sorted_stats = dict(sorted(stats.items(), key=lambda x:np.mean(x[1]), reverse=True))
-    for i, (pacman_name, values) in enumerate(sorted_stats.items()):
-        print(f"{i + 1}.\t{pacman_name}\t{values}\t{np.mean(values)}")
+    print_ranking(stats)
+
+def tournament(n_games=1000, workers=None):
+    pacmans = [
+        partial(BenioPacmanFunctionValueApproximation, train=False, use_predefined_weights=True),
+        partial(RandomPacman1, print_status=False),
+        partial(RandomPacman2, print_status=False),
+        partial(RandomPacman3, print_status=False)
+    ]
+    stats = run_tournament(board_big, pacmans, n_games, workers=workers)
+    print_ranking(stats)
 
 if __name__ == "__main__":
     test(10)
\ No newline at end of file
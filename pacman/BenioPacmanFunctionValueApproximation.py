@@ -1,18 +1,80 @@
 import math
 import random
-import dataclasses
+import sys
+from collections import deque
 import numpy as np
 from typing import Dict
 from pathlib import Path
 
+from .DistanceField import DistanceField, FAR, bfs_field, far_distances
+from .DistanceTable import walls_board, walls_distance_table
+from .ExperienceReplay import ExperienceReplay
 from .Pacman import Pacman
 from .Direction import Direction
-from .Helpers import can_move_in_direction, direction_to_new_position
+from .Helpers import can_move_in_direction, direction_to_new_position, get_closest_position
+
+
+# features in the order of the weights, each is 1 - distance to the nearest target / cap (0 past the cap)
+FEATURES = ['nearest_ghost', 'nearest_player', 'double_point', 'big_points', 'big_big_point', 'indestructible',
+            'point', 'nearest_eatable']
+NEAREST_GHOST, NEAREST_PLAYER, DOUBLE_POINT, BIG_POINTS, BIG_BIG_POINT, INDESTRUCTIBLE, POINT, NEAREST_EATABLE = \
+    range(len(FEATURES))
+CAPS = np.array([5, 5, 15, 15, 15, 15, 4, 10])
+# the GameState sets behind double_point .. point
+ITEM_SETS = ['double_points', 'big_points', 'big_big_points', 'indestructible_points', 'points']
+ITEM_FEATURES = range(DOUBLE_POINT, POINT + 1)
+
+
+def positions_array(positions) -> np.ndarray:
+    return np.array([(position.x, position.y) for position in positions], dtype=np.int64).reshape(-1, 2)
+
+
+class PositionArray:
+    """
+    A set of positions as an (n, 2) array, kept in step with the set by the few positions
+    that were eaten or spawned since the last update instead of being built again.
+    """
+    def __init__(self):
+        self.positions = frozenset()
+        self.array = np.zeros((0, 2), dtype=np.int64)
+        self.order = []  # position of every row
+        self.rows = {}
+
+    def update(self, positions) -> np.ndarray:
+        if positions is self.positions:
+            return self.array[:len(self.order)]
+        removed = self.positions - positions
+        added = positions - self.positions
+        if len(removed) + len(added) > len(positions) // 2:
+            self.order = list(positions)
+            self.array = positions_array(self.order)
+            self.rows = {position: row for row, position in enumerate(self.order)}
+        else:
+            for position in removed:
+                # the last row takes its place
+                row = self.rows.pop(position)
+                last = self.order.pop()
+                if last != position:
+                    self.order[row] = last
+                    self.rows[last] = row
+                    self.array[row] = self.array[len(self.order)]
+            if added:
+                n = len(self.order)
+                if n + len(added) > len(self.array):
+                    self.array = np.concatenate([self.array[:n], np.zeros((n + len(added), 2), dtype=np.int64)])
+                for row, position in enumerate(added, n):
+                    self.array[row] = position.x, position.y
+                    self.rows[position] = row
+                    self.order.append(position)
+        self.positions = positions
+        return self.array[:len(self.order)]
 
 
 class BenioPacmanFunctionValueApproximation(Pacman):
 
     FILENAME = 'weights.txt'
+    # the states whose features and Q-values are kept - the one of this tick and the one before
+    STATES_CACHED = 2
     # WEIGHTS = np.array([
     #     -3.998075444224211822e-02,
     #     5.767725387831480061e-04,
@@ -35,17 +97,33 @@ class BenioPacmanFunctionValueApproximation(Pacman):
         2.987511579494379552e-03
     ])
 
-    def __init__(self, train=False, use_predefined_weights=True, alpha = 0.001, discount = 0.5, epsilon = 0.25):
+    def __init__(self, train=False, use_predefined_weights=True, alpha = 0.001, discount = 0.5, epsilon = 0.25,
+                 maze_distances=False, replay_capacity=0, batch_size=32, replay_seed=None,
+                 history=2):
         super().__init__()
         self.train = train
         self.alpha = alpha
         self.discount = discount
         self.epsilon = epsilon
         self.use_predefined_weights = use_predefined_weights
+        # measure the features along the maze instead of as the crow flies (WEIGHTS were learned without it)
+        self.maze_distances = maze_distances
+        # learn from minibatches of the last replay_capacity transitions instead of only the last one (0 - off)
+        self.batch_size = batch_size
+        self.__replay = ExperienceReplay(replay_capacity, len(FEATURES), replay_seed) if replay_capacity else None
 
         self.__weights = self.WEIGHTS if use_predefined_weights else self.__load_weights()
-        self.__game_states_history = []
-        self.__actions_history = []
+        # the last states and actions seen, __update needs the last two
+        self.__game_states_history = deque(maxlen=max(history, 2))
+        self.__actions_history = deque(maxlen=max(history, 2))
+        # see __get_items
+        self.__items = {name: PositionArray() for name in ITEM_SETS}
+        # (walls, DistanceTable, Board) of the board and the DistanceField of every item set, see __get_table
+        self.__table = None
+        self.__fields = {}
+        # (state, action -> features, action -> Q-value) of the last STATES_CACHED states,
+        # the Q-values are dropped whenever the weights change
+        self.__cache = []
 
     def make_move(self, game_state, invalid_move=False) -> Direction:
         epsilon = self.epsilon if self.train else 0
@@ -99,14 +177,23 @@ class BenioPacmanFunctionValueApproximation(Pacman):
         if self.__weights is None:
             self.__weights = np.zeros((len(distances_and_nearest),))
 
-        # błąd tymczasowy
-        delta = (reward + self.discount * self.__get_value(state)) - self.__get_qvalue(prev_state, action)
-        # aktualizacja wag
-        self.__weights += self.alpha * delta * distances_and_nearest
+        if self.__replay is not None:
+            # the features stored are the ones already computed to choose the actions
+            self.__replay.add(distances_and_nearest, action, reward,
+                              self.__get_features(state, self.__get_legal_actions(state)))
+            batch = self.__replay.sample(self.batch_size)
+            self.__weights[:] = self.__replay.td_update(self.__weights, batch, self.alpha, self.discount)
+        else:
+            # błąd tymczasowy
+            delta = (reward + self.discount * self.__get_value(state)) - self.__get_qvalue(prev_state, action)
+            # aktualizacja wag
+            self.__weights += self.alpha * delta * distances_and_nearest
+        for _, _, qvalues in self.__cache:
+            qvalues.clear()
 
     def __get_best_action(self, game_state) -> Direction:
         legal_actions = self.__get_legal_actions(game_state)
-        qvalues = [self.__get_qvalue(game_state, action) for action in legal_actions]
+        qvalues = self.__get_qvalues(game_state, legal_actions).tolist()
         best_qvalue = max(qvalues)
         best_actions = [action for action, qvalue in zip(legal_actions, qvalues) if qvalue == best_qvalue]
         best_action = random.choice(best_actions)
@@ -129,160 +216,177 @@ class BenioPacmanFunctionValueApproximation(Pacman):
         if len(possible_actions) == 0:
             return 0.0
 
-        return max([self.__get_qvalue(game_state, action) for action in possible_actions])
+        return max(self.__get_qvalues(game_state, possible_actions).tolist())
 
     def __get_qvalue(self, game_state, action) -> float:
-        distances_and_nearest = self.__get_distances_and_nearest(game_state, action)
-        if self.__weights is None:
-            self.__weights = np.random.random((len(distances_and_nearest),))
-
-        qvalue = 0
-        for i in range(len(distances_and_nearest)):
-            qvalue += self.__weights[i] * distances_and_nearest[i]
-        return qvalue
+        return self.__get_qvalues(game_state, [action])[0]
+
+    # Q-values of all the actions at once, each computed once per state and weights
+    def __get_qvalues(self, game_state, actions) -> np.ndarray:
+        _, _, qvalues = self.__get_cached(game_state)
+        missing = [action for action in actions if action not in qvalues]
+        if missing:
+            features = self.__get_features(game_state, missing)
+            if self.__weights is None:
+                self.__weights = np.random.random((features.shape[1],))
+            # the products added up left to right like a dot product loop would, so equal Q-values stay equal
+            for action, qvalue in zip(missing, np.cumsum(features * self.__weights, axis=1)[:, -1]):
+                qvalues[action] = qvalue
+        return np.array([qvalues[action] for action in actions])
 
-    # Wartości z mapy
     def __get_distances_and_nearest(self, game_state, action):
-        next_game_state = self.__get_state_after_action(game_state, action)
-        nearest_ghost_distance = self.__get_nearest_ghost_distance(next_game_state)
-        nearest_player_distance = self.__get_nearest_player_distance(next_game_state)
-        double_point_distance = self.__get_double_point_distance(next_game_state)
-        big_points_distance = self.__get_big_points_distance(next_game_state)
-        big_big_point_distance = self.__get_big_big_points_distance(next_game_state)
-        indestructible_distance = self.__get_indestructible_distance(next_game_state)
-        point_distance = self.__get_point_distance(next_game_state)
-        nearest_eatable = self.__get_nearest_eatable(next_game_state)
-
-        return np.array([
-            nearest_ghost_distance,
-            nearest_player_distance,
-            double_point_distance,
-            big_points_distance,
-            big_big_point_distance,
-            indestructible_distance,
-            point_distance,
-            nearest_eatable,
-        ])
-
-    def __get_nearest_eatable(self, game_state):
-        eatable_ghosts = [ghost_info['position'] for ghost_info in game_state.ghosts if ghost_info['is_eatable']]
-        eatable_players = [player_info['position'] for player_info in game_state.other_pacmans if player_info['is_eatable']]
-        eatable_positions = eatable_ghosts + eatable_players
-
-        if len(eatable_positions) == 0:
-            return 0
-
-        distance = self.__get_distance_to_nearest(game_state.you['position'], eatable_positions)
-
-        distance = min(10, distance) / 10
-        rev_distance = 1 - distance
-        return rev_distance
-
-    def __get_nearest_ghost_distance(self, game_state):
-        is_indestructible = self.__is_timer_enabled(game_state.you['is_indestructible'])
-        if is_indestructible:
-            return 0
-
-        ghost_positions = [ghost_info['position'] for ghost_info in game_state.ghosts if not ghost_info['is_eatable']]
-        if len(ghost_positions) == 0:
-            return 0
-
-        distance = self.__get_distance_to_nearest(game_state.you['position'], ghost_positions)
-
-        distance = min(5, distance) / 5
-        rev_distance = 1 - distance
-        return rev_distance
-
-    def __get_nearest_player_distance(self, game_state):
-        is_indestructible = self.__is_timer_enabled(game_state.you['is_indestructible'])
-        if is_indestructible:
-            return 0
-
-        players_positions = [pacman_info['position'] for pacman_info in game_state.other_pacmans if not pacman_info['is_eatable']]
-        if len(players_positions) == 0:
-            return 0
-
-        distance = self.__get_distance_to_nearest(game_state.you['position'], players_positions)
-
-        distance = min(5, distance) / 5
-        rev_distance = 1 - distance
-        return rev_distance
-
-    def __get_double_point_distance(self, game_state):
-        is_active = self.__is_timer_enabled(game_state.you['double_points_timer'])
-        if is_active:
-            return 1.0
-
-        distance = self.__get_distance_to_nearest(game_state.you['position'], game_state.double_points)
-        if distance is None:
-            return 0
-
-        distance = min(15, distance) / 15
-        rev_distance = 1 - distance
-        return rev_distance
-
-    def __get_indestructible_distance(self, game_state):
-        is_active = self.__is_timer_enabled(game_state.you['is_indestructible'])
-        if is_active:
-            return 1.0
-
-        distance = self.__get_distance_to_nearest(game_state.you['position'], game_state.indestructible_points)
-        if distance is None:
-            return 0
-
-        distance = min(15, distance) / 15
-        rev_distance = 1 - distance
-        return rev_distance
-
-    def __get_big_points_distance(self, game_state):
-        distance = self.__get_distance_to_nearest(game_state.you['position'], game_state.big_points)
-        if distance is None:
-            return 0
-
-        distance = min(15, distance) / 15
-        rev_distance = 1 - distance
-        return rev_distance
-
-    def __get_big_big_points_distance(self, game_state):
-        distance = self.__get_distance_to_nearest(game_state.you['position'], game_state.big_big_points)
-        if distance is None:
-            return 0
-
-        distance = min(15, distance) / 15
-        rev_distance = 1 - distance
-        return rev_distance
-
-    def __get_point_distance(self, game_state):
-        distance = self.__get_distance_to_nearest(game_state.you['position'], game_state.points)
-        if distance is None:
-            return 0
-
-        distance = min(4, distance) / 4
-        rev_distance = 1 - distance
-        return rev_distance
-
-    def __get_state_after_action(self, game_state, action):
-        next_state = self.__copy_game_state(game_state)
-        next_state.you['position'] = direction_to_new_position(next_state.you['position'], action, game_state.board_size)
-        return next_state
-
-    # pomocne
-    def __copy_game_state(self, game_state):
-        new_you = dict(game_state.you)
-        new_game_state = dataclasses.replace(game_state, you=new_you)
-        return new_game_state
+        return self.__get_features(game_state, [action])[0]
+
+    # features of the actions, each computed once per state
+    def __get_features(self, game_state, actions) -> np.ndarray:
+        _, features, _ = self.__get_cached(game_state)
+        missing = [action for action in actions if action not in features]
+        if missing:
+            for action, row in zip(missing, self.__compute_features(game_state, missing)):
+                features[action] = row
+        return np.array([features[action] for action in actions])
+
+    def __get_cached(self, game_state):
+        for cached in self.__cache:
+            if cached[0] is game_state:
+                return cached
+        cached = (game_state, {}, {})
+        self.__cache.append(cached)
+        if len(self.__cache) > self.STATES_CACHED:
+            del self.__cache[0]
+        return cached
 
-    def __get_distance_to_nearest(self, start_point, end_points) -> int | None:
-        if len(end_points) == 0:
-            return None
-        distances = []
-        for end_point in end_points:
-            distance = self.__get_manhattan_distance(start_point, end_point)
-            distances.append(distance)
-        return min(distances)
-
-    def __get_manhattan_distance(self, start, end):
-        return abs(end.x - start.x) + abs(end.y - start.y)
+    # Wartości z mapy
+    # one row per action - the features of the state after it, in the order of FEATURES
+    def __compute_features(self, game_state, actions) -> np.ndarray:
+        you = game_state.you
+        successors = [direction_to_new_position(you['position'], action, game_state.board_size) for action in actions]
+        ghosts = [ghost['position'] for ghost in game_state.ghosts if not ghost['is_eatable']]
+        players = [pacman['position'] for pacman in game_state.other_pacmans if not pacman['is_eatable']]
+        eatable = [ghost['position'] for ghost in game_state.ghosts if ghost['is_eatable']] + \
+            [pacman['position'] for pacman in game_state.other_pacmans if pacman['is_eatable']]
+
+        if self.maze_distances:
+            nearest = self.__get_maze_distances(game_state, successors, ghosts, players, eatable)
+        else:
+            nearest = self.__get_manhattan_distances(game_state, successors, ghosts, players, eatable)
+        # FAR (nothing there) is past every cap, so its feature is 0
+        features = 1 - np.minimum(nearest, CAPS) / CAPS
+
+        if self.__is_timer_enabled(you['is_indestructible']):
+            features[:, [NEAREST_GHOST, NEAREST_PLAYER]] = 0
+            features[:, INDESTRUCTIBLE] = 1.0
+        if self.__is_timer_enabled(you['double_points_timer']):
+            features[:, DOUBLE_POINT] = 1.0
+        return features
+
+    # distance from every successor to the nearest target of every feature, FAR if there is none
+    def __get_manhattan_distances(self, game_state, successors, ghosts, players, eatable) -> np.ndarray:
+        positions = positions_array(successors)
+        # all the targets one group after the other, so the distances to all of them are one broadcast
+        items, item_counts = self.__get_items(game_state)
+        counts = np.array([len(ghosts), len(players)] + item_counts + [len(eatable)])
+        targets = np.concatenate([positions_array(ghosts + players), items, positions_array(eatable)])
+
+        nearest = np.full((len(successors), len(FEATURES)), FAR, dtype=np.int64)
+        present = counts > 0
+        if present.any():
+            distances = np.abs(positions[:, None, :] - targets[None, :, :]).sum(axis=2)
+            nearest[:, present] = np.minimum.reduceat(distances, (np.cumsum(counts) - counts)[present], axis=1)
+        return nearest
+
+    # the same with maze distances: looked up in the DistanceFields of the items at the successor cells,
+    # and in the rows of the few ghosts and pacmans
+    def __get_maze_distances(self, game_state, successors, ghosts, players, eatable) -> np.ndarray:
+        table = self.__get_table(game_state)
+        if table is None:
+            return self.__get_bfs_distances(game_state, successors, ghosts, players, eatable)
+        distances = far_distances(table)
+        cells = [table.closest_free(position) for position in successors]
+
+        nearest = np.empty((len(successors), len(FEATURES)), dtype=np.int64)
+        entities = ghosts + players + eatable
+        rows = distances[[table.closest_free(position) for position in entities]][:, cells]
+        start = 0
+        for feature, positions in ((NEAREST_GHOST, ghosts), (NEAREST_PLAYER, players), (NEAREST_EATABLE, eatable)):
+            nearest[:, feature] = rows[start:start + len(positions)].min(axis=0) if positions else FAR
+            start += len(positions)
+        for feature, name in zip(ITEM_FEATURES, ITEM_SETS):
+            nearest[:, feature] = self.__fields[name].update(getattr(game_state, name))[cells]
+        return nearest
+
+    # and on boards too big for a DistanceTable: a BFS from every successor, read at all the targets
+    def __get_bfs_distances(self, game_state, successors, ghosts, players, eatable) -> np.ndarray:
+        board = self.__table[2]
+        items, item_counts = self.__get_items(game_state)
+        counts = np.array([len(ghosts), len(players)] + item_counts + [len(eatable)])
+        targets = np.concatenate([np.array([self.__free_cell(board, position) for position in ghosts + players],
+                                           dtype=np.int64),
+                                  items[:, 1] * board.width + items[:, 0],
+                                  np.array([self.__free_cell(board, position) for position in eatable],
+                                           dtype=np.int64)])
+
+        nearest = np.full((len(successors), len(FEATURES)), FAR, dtype=np.int64)
+        present = counts > 0
+        if present.any():
+            starts = (np.cumsum(counts) - counts)[present]
+            for row, position in enumerate(successors):
+                field = bfs_field(board, self.__free_cell(board, position))
+                nearest[row, present] = np.minimum.reduceat(field[targets], starts)
+        return nearest
+
+    # the cell of the position, or the closest free one if it is a wall (like DistanceTable.closest_free)
+    def __free_cell(self, board, position) -> int:
+        if position in board.walls:
+            position = get_closest_position(position, board.walls, board.board_size)
+        return board.index(position)
+
+    # the DistanceTable of the board, None if it is too big for one (then the walls-only Board is kept)
+    def __get_table(self, game_state):
+        if self.__table is None or self.__table[0] is not game_state.walls:
+            table = walls_distance_table(game_state.walls, game_state.board_size)
+            board = None
+            if table is None:
+                board = walls_board(game_state.walls, game_state.board_size)
+            elif self.__table is None or self.__table[1] is not table:
+                self.__fields = {name: DistanceField(table) for name in ITEM_SETS}
+            self.__table = game_state.walls, table, board
+        return self.__table[1]
+
+    # the item sets as one array of positions and the size of each
+    def __get_items(self, game_state):
+        arrays = [self.__items[name].update(getattr(game_state, name)) for name in ITEM_SETS]
+        return np.concatenate(arrays), [len(array) for array in arrays]
+
+    """
+    Bytes held by the history, the cached features and Q-values and the replay buffer. The states count
+    their own containers (a set shared by several states once), not the positions inside.
+    """
+    def memory_usage(self) -> int:
+        seen = set()
+        total = 0
+
+        def add(obj):
+            nonlocal total
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                total += obj.nbytes if isinstance(obj, np.ndarray) else sys.getsizeof(obj)
+
+        for history in (self.__game_states_history, self.__actions_history):
+            add(history)
+        for state in self.__game_states_history:
+            add(state)
+            for value in vars(state).values():
+                add(value)
+                if isinstance(value, list):
+                    for entity in value:
+                        add(entity)
+        for state, features, qvalues in self.__cache:
+            add(features)
+            add(qvalues)
+            for row in features.values():
+                add(row)
+        return total + (self.__replay.nbytes if self.__replay is not None else 0)
 
     def __get_euclidean_distance(self, start, end):
         return math.sqrt((end.x - start.x) ** 2 + (end.y - start.y) ** 2)
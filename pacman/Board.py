@@ -0,0 +1,210 @@
+import hashlib
+import os
+import zipfile
+import zlib
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .Direction import Direction
+from .Position import Position
+
+"""
+Cell types of a compiled board. Every cell of the grid is a uint8 made of these flags,
+so one cell can hold e.g. a spawner and the item it spawned at the same time.
+"""
+WALL = 1
+POINT = 2
+BIG_POINT = 4
+BIG_BIG_POINT = 8
+PHASING_POINT = 16
+DOUBLE_POINT = 32
+INDESTRUCTIBLE_POINT = 64
+SPAWNER = 128
+
+# the order matters - it is the order Game.update_spawners_timers draws the spawned item in
+SPAWNED_ITEMS = [PHASING_POINT, DOUBLE_POINT, INDESTRUCTIBLE_POINT, BIG_BIG_POINT]
+SPAWNED_ITEMS_MASK = PHASING_POINT | DOUBLE_POINT | INDESTRUCTIBLE_POINT | BIG_BIG_POINT
+ITEMS_MASK = POINT | BIG_POINT | SPAWNED_ITEMS_MASK
+
+CELL_TYPES = {
+    'w': WALL,
+    '*': POINT,
+    '+': BIG_POINT,
+    'b': BIG_BIG_POINT,
+    'z': PHASING_POINT,
+    'd': DOUBLE_POINT,
+    'i': INDESTRUCTIBLE_POINT,
+    's': SPAWNER,
+}
+
+
+# where things computed once per board (e.g. DistanceTable) are kept between runs
+CACHE_DIR = os.environ.get('PACMAN_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'pacman-for-rl'))
+
+
+def board_hash(board: List[str]) -> bytes:
+    return hashlib.blake2b('\n'.join(board).encode(), digest_size=16).digest()
+
+
+"""
+Writes the arrays to an .npz file aside and renames it, so another process never reads half a file.
+A cache that can't be written is not an error, the caller just computes again next time.
+"""
+def save_arrays(path: str, **arrays: np.ndarray):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(temporary, path)
+    except OSError:
+        pass
+
+
+"""
+The arrays of an .npz file written by save_arrays, None if there is none or it can't be read
+(broken, cut short or without some of them), so the caller computes them again.
+"""
+def load_arrays(path: str, names: Tuple[str, ...]) -> Optional[Dict[str, np.ndarray]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as saved:
+            return {name: saved[name] for name in names}
+    except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile, zlib.error):
+        return None
+
+
+# the arrays a Board is saved as, everything else is derived from them
+ARRAYS = ('cells', 'player_starts', 'ghost_starts', 'spawners', 'neighbours', 'legal_moves')
+# part of the name of the saved boards, bump it when __compile or ARRAYS change so old files are not read
+FORMAT = 1
+
+
+class Board:
+    """
+    Board strings compiled once into a flat uint8 cell grid (index = y * width + x)
+    with a neighbour table that already knows about the wraparound.
+    A compiled board is only read by the games, so one Board (see compile_board) serves all of them.
+    """
+    def __init__(self, board: List[str], arrays: Dict[str, np.ndarray] = None):
+        self.rows = list(board)
+        self.width = len(board[0])
+        self.height = len(board)
+        self.board_size = (self.width, self.height)
+        self.n_cells = self.width * self.height
+
+        if arrays is None:
+            arrays = self.__compile()
+        self.cells = arrays['cells']
+        self.player_starts = [int(index) for index in arrays['player_starts']]
+        self.ghost_starts = [int(index) for index in arrays['ghost_starts']]
+        self.spawners = [int(index) for index in arrays['spawners']]
+        self.neighbours = arrays['neighbours']
+        # legal_moves[cell, direction] - the move doesn't run into a wall
+        self.legal_moves = arrays['legal_moves']
+        for array in (self.cells, self.neighbours, self.legal_moves):
+            array.setflags(write=False)
+
+        self.positions = [Position(index % self.width, index // self.width) for index in range(self.n_cells)]
+        self.walls = frozenset(self.positions[index] for index in np.flatnonzero(self.cells & WALL))
+        self.is_wall = [bool(cell & WALL) for cell in self.cells]
+        self.neighbours_list = [tuple(int(n) for n in row) for row in self.neighbours]
+        self.legal_moves_list = [tuple(bool(legal) for legal in row) for row in self.legal_moves]
+
+        # a cell surrounded by walls - Game lets players phase out of it
+        self.is_stuck = [not any(row) for row in self.legal_moves_list]
+        self.item_positions_cache = {}
+
+    def __compile(self) -> Dict[str, np.ndarray]:
+        cells = np.zeros(self.n_cells, dtype=np.uint8)
+        player_starts = []
+        ghost_starts = []
+        spawners = set()
+
+        for y, line in enumerate(self.rows):
+            for x, obj in enumerate(line):
+                index = y * self.width + x
+                if obj == 'p':
+                    player_starts.append(index)
+                elif obj == 'g':
+                    ghost_starts.append(index)
+                elif obj in CELL_TYPES:
+                    cells[index] = CELL_TYPES[obj]
+                if obj == 's':
+                    spawners.add(Position(x, y))
+
+        neighbours = np.zeros((self.n_cells, len(Direction)), dtype=np.int32)
+        for index in range(self.n_cells):
+            x, y = index % self.width, index // self.width
+            neighbours[index, Direction.UP.value] = ((y - 1) % self.height) * self.width + x
+            neighbours[index, Direction.DOWN.value] = ((y + 1) % self.height) * self.width + x
+            neighbours[index, Direction.LEFT.value] = y * self.width + (x - 1) % self.width
+            neighbours[index, Direction.RIGHT.value] = y * self.width + (x + 1) % self.width
+
+        # walk the spawners in the same order Game always did (it kept them in a set)
+        return {'cells': cells, 'player_starts': np.array(player_starts, dtype=np.int32),
+                'ghost_starts': np.array(ghost_starts, dtype=np.int32),
+                'spawners': np.array([self.index(position) for position in spawners], dtype=np.int32),
+                'neighbours': neighbours, 'legal_moves': (cells[neighbours] & WALL) == 0}
+
+    def save(self, path: str):
+        save_arrays(path, **{name: np.asarray(getattr(self, name)) for name in ARRAYS})
+
+    """
+    The board saved at path, None if there is none or it doesn't fit the board strings.
+    """
+    @staticmethod
+    def load(board: List[str], path: str) -> Optional['Board']:
+        arrays = load_arrays(path, ARRAYS)
+        if arrays is None:
+            return None
+        n_cells = len(board[0]) * len(board)
+        if arrays['cells'].shape != (n_cells,) or arrays['neighbours'].shape != (n_cells, len(Direction)):
+            return None
+        return Board(board, arrays)
+
+    def index(self, position: Position) -> int:
+        return position.y * self.width + position.x
+
+    def positions_of(self, cells: np.ndarray, cell_type: int) -> set:
+        return {self.positions[index] for index in np.flatnonzero(cells & cell_type)}
+
+    """
+    Positions of the cells holding cell_type at the start of a game, in the order of the board strings,
+    so a set filled from them iterates in the same order as one filled while reading the strings.
+    """
+    def item_positions(self, cell_type: int) -> Tuple[Position, ...]:
+        positions = self.item_positions_cache.get(cell_type)
+        if positions is None:
+            positions = self.item_positions_cache[cell_type] = \
+                tuple(self.positions[index] for index in np.flatnonzero(self.cells & cell_type))
+        return positions
+
+
+_boards: Dict[bytes, Board] = {}
+
+
+"""
+The compiled Board of the board strings, compiled once per process and kept in cache_dir between runs
+(under the hash of the board strings), so every Game and worker on the same board shares it.
+Pass cache_dir=None to keep it in memory only.
+"""
+def compile_board(board: Union[List[str], Board], cache_dir: Optional[str] = CACHE_DIR) -> Board:
+    rows = board.rows if isinstance(board, Board) else board
+    key = board_hash(rows)
+    if key in _boards:
+        return _boards[key]
+    if isinstance(board, Board):
+        _boards[key] = board
+        return board
+
+    path = os.path.join(cache_dir, f"board-{FORMAT}-{key.hex()}.npz") if cache_dir is not None else None
+    compiled = Board.load(board, path) if path is not None else None
+    if compiled is None:
+        compiled = Board(board)
+        if path is not None:
+            compiled.save(path)
+    _boards[key] = compiled
+    return compiled
@@ -0,0 +1,74 @@
+from typing import AbstractSet
+
+import numpy as np
+
+from .Board import Board, WALL
+from .DistanceTable import DistanceTable
+
+"""
+Maze distance from every free cell to the closest of a set of positions (e.g. all the points), read from
+the rows of a DistanceTable. Items are only eaten and spawned a few at a time, so the field is kept
+in step with the set: an added position can only bring cells closer, and a removed one only changes
+the cells it was the closest position of, which are computed again from the positions that are left.
+"""
+
+# the table distances seen as unsigned, so UNREACHABLE (-1) is further than any real distance
+FAR = np.iinfo(np.uint16).max
+
+
+def far_distances(table: DistanceTable) -> np.ndarray:
+    return table.distances.view(np.uint16)
+
+
+"""
+Maze distance from the start cell to every cell of the board (index = y * width + x), FAR for the walls
+and the cells that can't be reached. One BFS, a layer at a time - for boards too big for a DistanceTable.
+"""
+def bfs_field(board: Board, start: int) -> np.ndarray:
+    field = np.full(board.n_cells, FAR, dtype=np.uint16)
+    free = (board.cells & WALL) == 0
+    field[start] = 0
+    frontier = np.array([start])
+    distance = 0
+    while len(frontier):
+        distance += 1
+        reached = board.neighbours[frontier].ravel()
+        frontier = np.unique(reached[free[reached] & (field[reached] == FAR)])
+        field[frontier] = distance
+    return field
+
+
+class DistanceField:
+    def __init__(self, table: DistanceTable):
+        self.table = table
+        self.distances = far_distances(table)
+        self.positions = frozenset()
+        self.sources = set()  # free cell numbers of the positions
+        self.field = np.full(len(table.free_cells), FAR, dtype=np.uint16)
+
+    """
+    The field of positions (ordered like table.free_cells), FAR where no position can be reached.
+    """
+    def update(self, positions: AbstractSet) -> np.ndarray:
+        if positions is self.positions:
+            return self.field
+        removed = self.positions - positions
+        added = positions - self.positions
+        if len(removed) + len(added) > len(positions) // 2:
+            self.sources = {self.table.closest_free(position) for position in positions}
+            self.field[:] = self.distances[list(self.sources)].min(axis=0) if self.sources else FAR
+        else:
+            for position in removed:
+                source = self.table.closest_free(position)
+                self.sources.discard(source)
+                changed = np.flatnonzero(self.field == self.distances[source])
+                if len(changed):
+                    # the distances are symmetric, so the rows of the changed cells hold them too
+                    self.field[changed] = self.distances[changed[:, None], list(self.sources)].min(axis=1) \
+                        if self.sources else FAR
+            for position in added:
+                source = self.table.closest_free(position)
+                self.sources.add(source)
+                np.minimum(self.field, self.distances[source], out=self.field)
+        self.positions = positions
+        return self.field
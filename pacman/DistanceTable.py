@@ -0,0 +1,186 @@
+import os
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from .Board import Board, CACHE_DIR, WALL, board_hash, compile_board, load_arrays, save_arrays
+from .Direction import Direction
+from .Helpers import get_closest_position
+from .Position import Position
+
+"""
+Maze distance and first step between every two free cells of a board, with the wraparound.
+All the BFS runs are done at once: row s of the frontier matrix is the frontier of the BFS from free cell s,
+so one step of all of them is a few boolean gathers over the neighbour table.
+The first step from s to t is the first Direction (in enum order) whose neighbour is one step closer to t,
+which is the step Helpers.find_path takes too (its BFS visits the neighbours in the same order).
+"""
+
+UNREACHABLE = -1
+NO_STEP = -1
+# part of the name of the saved tables, bump it when what __compute writes changes so old files are not read
+FORMAT = 1
+# the table holds every pair of free cells and takes a BFS from each of them to build, so past this many
+# free cells the callers search their way instead
+MAX_FREE_CELLS = 1024
+
+DIRECTIONS = list(Direction)
+
+
+class DistanceTable:
+    def __init__(self, board: Union[List[str], Board], distances: np.ndarray = None, next_hops: np.ndarray = None):
+        self.board = compile_board(board)
+        self.width, self.height = self.board.board_size
+
+        # free cell number -> cell index and back (-1 for walls)
+        self.free_cells = np.flatnonzero((self.board.cells & WALL) == 0)
+        self.free_index = np.full(self.board.n_cells, -1, dtype=np.int32)
+        self.free_index[self.free_cells] = np.arange(len(self.free_cells), dtype=np.int32)
+        self.neighbours = self.free_index[self.board.neighbours[self.free_cells]]
+
+        if distances is None or next_hops is None:
+            distances, next_hops = self.__compute()
+        self.distances = distances
+        self.next_hops = next_hops
+        # cell index -> free cell number of the closest free cell, filled as asked
+        self.closest = {}
+
+    def __compute(self):
+        n_free = len(self.free_cells)
+        # a wall neighbour points at an extra column that is never reached
+        neighbours = np.where(self.neighbours >= 0, self.neighbours, n_free)
+
+        distances = np.full((n_free, n_free), UNREACHABLE, dtype=np.int16)
+        np.fill_diagonal(distances, 0)
+        frontier = np.zeros((n_free, n_free + 1), dtype=bool)
+        frontier[:, :n_free] = np.eye(n_free, dtype=bool)
+        visited = frontier[:, :n_free].copy()
+        step = 0
+        while True:
+            step += 1
+            # t is reached when any of its neighbours was in the frontier (the moves are symmetric)
+            reached = frontier[:, neighbours[:, 0]]
+            for direction in range(1, len(DIRECTIONS)):
+                reached |= frontier[:, neighbours[:, direction]]
+            reached &= ~visited
+            if not reached.any():
+                break
+            visited |= reached
+            distances[reached] = step
+            frontier[:, :n_free] = reached
+
+        # the first direction that gets one step closer wins, so go over them backwards
+        next_hops = np.full((n_free, n_free), NO_STEP, dtype=np.int8)
+        padded = np.vstack([distances, np.full((1, n_free), UNREACHABLE, dtype=np.int16)])
+        closer = distances - 1
+        for direction in reversed(range(len(DIRECTIONS))):
+            step_distances = padded[neighbours[:, direction]]
+            next_hops[(step_distances == closer) & (distances > 0)] = direction
+        return distances, next_hops
+
+    def index(self, position: Position) -> int:
+        return int(self.free_index[(position.y % self.height) * self.width + position.x % self.width])
+
+    def position(self, index: int) -> Position:
+        return self.board.positions[self.free_cells[index]]
+
+    """
+    Free cell number of the position, or of the closest free cell if it is a wall (see Helpers.get_closest_position).
+    """
+    def closest_free(self, position: Position) -> int:
+        cell = (position.y % self.height) * self.width + position.x % self.width
+        index = self.closest.get(cell)
+        if index is None:
+            index = self.free_index[cell]
+            if index < 0:
+                closest = get_closest_position(self.board.positions[cell], self.board.walls, self.board.board_size)
+                index = self.free_index[self.board.index(closest)]
+            index = self.closest[cell] = int(index)
+        return index
+
+    """
+    Number of moves from start to end, None if one of them is a wall or end can't be reached.
+    """
+    def distance(self, start: Position, end: Position) -> Optional[int]:
+        start, end = self.index(start), self.index(end)
+        if start < 0 or end < 0 or self.distances[start, end] == UNREACHABLE:
+            return None
+        return int(self.distances[start, end])
+
+    """
+    Distances from start to every free cell (ordered like free_cells), UNREACHABLE where there is no way.
+    """
+    def distances_from(self, start: Position) -> np.ndarray:
+        return self.distances[self.index(start)]
+
+    """
+    The first move on the way from start to end, None if there is none.
+    """
+    def next_direction(self, start: Position, end: Position) -> Optional[Direction]:
+        start, end = self.index(start), self.index(end)
+        if start < 0 or end < 0 or self.next_hops[start, end] == NO_STEP:
+            return None
+        return DIRECTIONS[self.next_hops[start, end]]
+
+    """
+    Positions after start up to end, like Helpers.find_path for an end that is not a wall.
+    """
+    def path(self, start: Position, end: Position) -> List[Position]:
+        start, end = self.index(start), self.index(end)
+        if start < 0 or end < 0 or self.distances[start, end] == UNREACHABLE:
+            return []
+        path = []
+        while start != end:
+            start = int(self.neighbours[start, self.next_hops[start, end]])
+            path.append(self.position(start))
+        return path
+
+
+_tables: Dict[bytes, DistanceTable] = {}
+
+
+"""
+The DistanceTable of a board, computed once per process and kept in cache_dir between runs
+(under the hash of the board strings). Pass cache_dir=None to keep it in memory only.
+"""
+def distance_table(board: Union[List[str], Board], cache_dir: Optional[str] = CACHE_DIR) -> DistanceTable:
+    board = compile_board(board)
+    key = board_hash(board.rows)
+    if key in _tables:
+        return _tables[key]
+
+    table = None
+    path = os.path.join(cache_dir, f"distances-{FORMAT}-{key.hex()}.npz") if cache_dir is not None else None
+    cached = load_arrays(path, ('distances', 'next_hops')) if path is not None else None
+    if cached is not None:
+        table = DistanceTable(board, cached['distances'], cached['next_hops'])
+        n_free = len(table.free_cells)
+        if table.distances.shape != (n_free, n_free) or table.next_hops.shape != (n_free, n_free):
+            table = None
+    if table is None:
+        table = DistanceTable(board)
+        if path is not None:
+            save_arrays(path, distances=table.distances, next_hops=table.next_hops)
+
+    _tables[key] = table
+    return table
+
+
+"""
+The compiled Board with these walls and nothing else, for when only a GameState is at hand
+(the items on a board don't change its distances).
+"""
+def walls_board(walls: Set[Position], board_size: Tuple[int, int]) -> Board:
+    width, height = board_size
+    return compile_board([''.join('w' if Position(x, y) in walls else ' ' for x in range(width))
+                          for y in range(height)])
+
+
+"""
+The DistanceTable of the board with these walls, None if it has more than MAX_FREE_CELLS free cells.
+"""
+def walls_distance_table(walls: Set[Position], board_size: Tuple[int, int],
+                         cache_dir: Optional[str] = CACHE_DIR) -> Optional[DistanceTable]:
+    if board_size[0] * board_size[1] - len(walls) > MAX_FREE_CELLS:
+        return None
+    return distance_table(walls_board(walls, board_size), cache_dir)
@@ -0,0 +1,57 @@
+import numpy as np
+
+from .Direction import Direction
+
+"""
+The last capacity transitions of a feature based agent in preallocated arrays, written round-robin:
+the features of the state and action taken, the action, the reward and the features of every legal action
+in the next state (padded to one row per Direction, next_legal tells which rows are real).
+"""
+
+
+class ExperienceReplay:
+    def __init__(self, capacity: int, n_features: int, seed=None):
+        self.capacity = capacity
+        self.features = np.zeros((capacity, n_features))
+        self.actions = np.zeros(capacity, dtype=np.int8)
+        self.rewards = np.zeros(capacity)
+        self.next_features = np.zeros((capacity, len(Direction), n_features))
+        self.next_legal = np.zeros((capacity, len(Direction)), dtype=bool)
+        self.size = 0
+        self.position = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, features: np.ndarray, action: Direction, reward: float, next_features: np.ndarray):
+        i = self.position
+        self.features[i] = features
+        self.actions[i] = action.value
+        self.rewards[i] = reward
+        n = len(next_features)
+        if n:
+            self.next_features[i, :n] = next_features
+        self.next_legal[i] = False
+        self.next_legal[i, :n] = True
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    """
+    Indices of batch_size transitions drawn uniformly (with repeats) from the ones stored.
+    """
+    def sample(self, batch_size: int) -> np.ndarray:
+        return self.rng.integers(0, self.size, size=batch_size)
+
+    """
+    One step of TD(0) on linear Q-values for a minibatch: the mean of alpha * delta * features over the
+    batch, where delta = reward + discount * max Q(next state) - Q(state, action). Returns the new weights.
+    """
+    def td_update(self, weights: np.ndarray, batch: np.ndarray, alpha: float, discount: float) -> np.ndarray:
+        features = self.features[batch]
+        next_qvalues = np.where(self.next_legal[batch], self.next_features[batch] @ weights, -np.inf).max(axis=1)
+        next_qvalues[~self.next_legal[batch].any(axis=1)] = 0.0
+        delta = self.rewards[batch] + discount * next_qvalues - features @ weights
+        return weights + alpha * (delta @ features) / len(batch)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.features, self.actions, self.rewards, self.next_features,
+                                              self.next_legal))
@@ -0,0 +1,144 @@
+import struct
+import zlib
+
+import numpy as np
+
+from .Board import WALL, POINT, BIG_POINT, BIG_BIG_POINT, PHASING_POINT, DOUBLE_POINT, INDESTRUCTIBLE_POINT
+from .Game import CELLS_CHANNEL, PLAYERS_CHANNEL, GHOSTS_CHANNEL, GHOST, EATABLE_GHOST
+
+"""
+Draws RGB frames as NumPy arrays without pygame or a display, from the observation grid of
+Game.get_observation / HeadlessGame.get_observation (or one game of VectorEnv.observations).
+Every cell becomes a cell_size x cell_size tile: the layers (floor or wall, item, player, ghost)
+are looked up in a tile table for the whole grid at once and stacked, later layers on top.
+Colors follow the pygame window, but sprites are plain shapes aligned to their cells.
+"""
+
+FLOOR_COLOR = (0, 0, 0)
+WALL_COLOR = (0, 255, 255)
+# in the order Game draws them, so a later one wins on a cell holding both
+ITEM_COLORS = [(POINT, (255, 255, 255)), (BIG_POINT, (255, 255, 255)), (PHASING_POINT, (255, 0, 255)),
+               (DOUBLE_POINT, (255, 255, 0)), (INDESTRUCTIBLE_POINT, (0, 255, 0)), (BIG_BIG_POINT, (255, 0, 0))]
+PLAYER_COLORS = [(255, 255, 0), (255, 0, 0), (0, 255, 255), (255, 255, 255)]
+GHOST_COLOR = (255, 80, 80)
+EATABLE_GHOST_COLOR = (40, 40, 255)
+
+
+def disc(cell_size, size):
+    center = (cell_size - 1) / 2
+    y, x = np.mgrid[:cell_size, :cell_size]
+    return (x - center) ** 2 + (y - center) ** 2 <= (size / 2) ** 2
+
+
+class FrameRenderer:
+    def __init__(self, cell_size=12):
+        self.cell_size = cell_size
+        tiles = [np.zeros((cell_size, cell_size), dtype=bool)]  # nothing to draw
+        colors = [FLOOR_COLOR]
+
+        def add_tile(mask, color):
+            tiles.append(mask)
+            colors.append(color)
+            return len(tiles) - 1
+
+        full = np.ones((cell_size, cell_size), dtype=bool)
+        self.floor = add_tile(full, FLOOR_COLOR)
+        self.wall = add_tile(full, WALL_COLOR)
+
+        item_sizes = {POINT: cell_size // 6, BIG_POINT: cell_size // 3, BIG_BIG_POINT: cell_size // 2}
+        self.items = [(flag, add_tile(disc(cell_size, max(item_sizes.get(flag, cell_size // 3), 1)), color))
+                      for flag, color in ITEM_COLORS]
+
+        player = full.copy()
+        player[[0, -1], :] = player[:, [0, -1]] = False
+        self.first_player = len(tiles)
+        for color in PLAYER_COLORS:
+            add_tile(player, color)
+
+        ghost = disc(cell_size, cell_size)
+        ghost[cell_size // 2:, :] = player[cell_size // 2:, :]
+        self.ghosts = np.zeros(max(GHOST, EATABLE_GHOST) + 1, dtype=np.int64)
+        self.ghosts[GHOST] = add_tile(ghost, GHOST_COLOR)
+        self.ghosts[EATABLE_GHOST] = add_tile(ghost, EATABLE_GHOST_COLOR)
+
+        self.masks = np.stack(tiles)
+        self.tiles = np.where(self.masks[..., None], np.array(colors, dtype=np.uint8)[:, None, None, :], 0) \
+            .astype(np.uint8)
+
+    """
+    An observation of shape (channels, height, width) to an RGB frame of shape
+    (height * cell_size, width * cell_size, 3).
+    """
+    def render(self, observation: np.ndarray) -> np.ndarray:
+        cells = observation[CELLS_CHANNEL]
+        players = observation[PLAYERS_CHANNEL].astype(np.int64)
+        ghosts = observation[GHOSTS_CHANNEL]
+
+        frame = self.tiles[np.where(cells & WALL, self.wall, self.floor)]
+
+        items = np.zeros(cells.shape, dtype=np.int64)
+        for flag, tile in self.items:
+            items = np.where(cells & flag, tile, items)
+        players = np.where(players > 0, self.first_player + (players - 1) % len(PLAYER_COLORS), 0)
+        for layer in (items, players, self.ghosts[ghosts]):
+            drawn = layer > 0
+            if drawn.any():
+                rows, columns = np.nonzero(drawn)
+                tiles = layer[rows, columns]
+                frame[rows, columns] = np.where(self.masks[tiles][..., None], self.tiles[tiles], frame[rows, columns])
+
+        height, width = cells.shape
+        return frame.transpose(0, 2, 1, 3, 4).reshape(height * self.cell_size, width * self.cell_size, 3)
+
+
+"""
+Frame stream file layout (little endian): magic, version, height, width, then for every frame
+its size and the zlib compressed XOR of the frame with the previous one. Consecutive frames differ
+in a few cells only, so the XOR is mostly zeros and compresses very well.
+"""
+
+MAGIC = b'PACV'
+VERSION = 1
+HEADER = struct.Struct('<4sBHH')
+FRAME_HEADER = struct.Struct('<I')
+
+
+class FrameStreamWriter:
+    def __init__(self, path, level=6):
+        self.file = open(path, 'wb', buffering=1 << 16)
+        self.level = level
+        self.previous = None
+
+    def write(self, frame: np.ndarray):
+        if self.previous is None:
+            self.file.write(HEADER.pack(MAGIC, VERSION, frame.shape[0], frame.shape[1]))
+            self.previous = np.zeros_like(frame)
+        elif frame.shape != self.previous.shape:
+            raise ValueError(f"frame of shape {frame.shape} in a stream of {self.previous.shape}")
+        data = zlib.compress(np.bitwise_xor(frame, self.previous).tobytes(), self.level)
+        self.file.write(FRAME_HEADER.pack(len(data)) + data)
+        self.previous = frame.copy()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_frame_stream(path):
+    with open(path, 'rb') as file:
+        magic, version, height, width = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a frame stream")
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        while True:
+            size = file.read(FRAME_HEADER.size)
+            if not size:
+                return
+            data = zlib.decompress(file.read(FRAME_HEADER.unpack(size)[0]))
+            frame = np.bitwise_xor(frame, np.frombuffer(data, dtype=np.uint8).reshape(frame.shape))
+            yield frame
@@ -1,15 +1,23 @@
 import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 
+import numpy as np
 import pygame
-from typing import List
+from typing import List, Dict, Tuple, FrozenSet, Any, Optional, Union
 
 from .Ghost import Ghost
 from .Pacman import Pacman
 from .Position import Position
 from .Direction import Direction
 from .GameState import GameState
-from copy import deepcopy
+from .GhostFields import ghost_fields
 from .Helpers import can_move_in_direction, direction_to_new_position
+from .Board import WALL, POINT, BIG_POINT, BIG_BIG_POINT, PHASING_POINT, DOUBLE_POINT, INDESTRUCTIBLE_POINT, \
+    SPAWNER, SPAWNED_ITEMS_MASK, Board, compile_board
+from .Occupancy import Occupancy
+from .TimerWheel import TimerWheel
 
 BIG_POINT_VALUE = 5
 BIG_BIG_POINT_VALUE = 20
@@ -18,6 +26,31 @@ ENEMY_VALUE = 20
 TIMER = 15
 TIMER_SPAWNER = TIMER * 3
 
+RESETTABLE_SETS = ['points', 'big_points', 'big_big_points', 'phasing_points', 'indestructible_points',
+                   'double_points']
+# what a spawner can spawn, in the order it is drawn in
+SPAWNABLE_SETS = ['phasing_points', 'double_points', 'indestructible_points', 'big_big_points']
+# flag of every item set in Game.cell_items
+ITEM_TYPES = {'points': POINT, 'big_points': BIG_POINT, 'big_big_points': BIG_BIG_POINT,
+              'phasing_points': PHASING_POINT, 'indestructible_points': INDESTRUCTIBLE_POINT,
+              'double_points': DOUBLE_POINT}
+
+# channels of get_observation
+CELLS_CHANNEL = 0  # cell type flags, see Board
+PLAYERS_CHANNEL = 1  # player slot + 1
+GHOSTS_CHANNEL = 2  # GHOST or EATABLE_GHOST
+OBSERVATION_CHANNELS = 3
+
+GHOST = 1
+EATABLE_GHOST = 2
+
+# columns of get_timers, ticks left of each timer of a player
+EATABLE_TIMER = 0
+PHASING_TIMER = 1
+DOUBLE_POINTS_TIMER = 2
+INDESTRUCTIBLE_TIMER = 3
+PLAYER_TIMERS = 4
+
 
 def my_itemgetter(*items):
     if len(items) == 1:
@@ -30,19 +63,62 @@ def my_itemgetter(*items):
             return tuple(obj[item] for item in items)
     return g
 
+"""
+Everything that changes during a game, see Game.snapshot.
+The dicts are copies and the sets are the frozen views, so taking one is cheap.
+Timers hold the tick they expire in, see Game.update_timers.
+"""
+@dataclass(frozen=True)
+class GameSnapshot:
+    players: Tuple[Pacman, ...]
+    positions: Dict[Any, Position]
+    directions: Dict[Any, Direction]
+    eatable_timers: Dict[Any, int]
+    phasing_timers: Dict[Pacman, int]
+    double_points_timers: Dict[Pacman, int]
+    indestructible_timers: Dict[Pacman, int]
+    spawners_timers: Dict[Position, int]
+    active_spawners: FrozenSet[Position]
+    items: Dict[str, FrozenSet[Position]]
+    ghosts_were_eatable: Tuple[bool, ...]
+    ghost_routes: Tuple[Optional[Tuple[List[Position], Optional[Position], int]], ...]
+    skip_ghosts: bool
+    final_scores: Dict[Pacman, int]
+    rng_state: tuple
+    ticks: int
+
+
+"""
+With display_mode_on the game is drawn every render_every ticks with a delay after every frame.
+With render_fps set it is drawn at most that many times a second instead, without any delay,
+so the game runs at full speed and only as many frames as can be watched are drawn.
+Frames are always drawn between two ticks, on the thread that plays the game (pygame has to be
+used from one thread), so a frame never shows half of a tick. The last state of a game is always drawn.
+"""
 class Game:
-    def __init__(self, board: List[str], ghosts: List[Ghost], players: List[Pacman], display_mode_on=False, delay=100):
-        self.board = board
+    def __init__(self, board: Union[List[str], Board], ghosts: List[Ghost], players: List[Pacman],
+                 display_mode_on=False, delay=100, render_every=1, render_fps=None):
+        # the board strings and the Board compiled from them, shared with every other game on the same board
+        self.compiled = compile_board(board)
+        self.board = self.compiled.rows
         self.display_mode_on = display_mode_on
         self.delay = delay
+        self.render_every = render_every
+        self.render_fps = render_fps
+        self.next_frame_time = 0
         self.skip_ghosts = False
 
         self.players = players
         self.all_players = players.copy()
         self.players_colors = dict(zip(players, ['yellow', 'red', 'cyan', 'white']))
         self.ghosts = ghosts
+        self.ghosts_order = {ghost: i for i, ghost in enumerate(ghosts)}
+        self.players_order = {}
+        self.occupancy = None
+        # maze distances for the ghosts, None on boards too big for them (see GhostFields)
+        self.ghost_fields = ghost_fields(self.compiled)
 
-        self.cell_size = 550 // (len(board[0]))
+        self.cell_size = 550 // (len(self.board[0]))
 
         self.player_size = self.cell_size
         self.point_size = self.cell_size // 6
@@ -52,6 +128,12 @@ class Game:
         self.screen = None
         self.player_image = None
         self.ghost_image = None
+        # the walls drawn once, see __draw_board
+        self.background = None
+        # entity -> (rect, image) of the sprites on the screen
+        self.drawn_sprites = {}
+        # cells whose items changed since the last frame
+        self.dirty_cells = set()
         self.board_size = None
 
         self.positions = {}
@@ -62,7 +144,10 @@ class Game:
         self.double_points_timers = {}
         self.indestructible_timers = {}
         self.spawners_timers = {}
-        self.walls = set()
+        # spawners whose item is on the board
+        self.active_spawners = set()
+        self.timer_wheel = TimerWheel()
+        self.walls = frozenset()
         self.points = set()
         self.big_points = set()
         self.big_big_points = set()
@@ -71,47 +156,53 @@ class Game:
         self.double_points = set()
         self.regenerate_points = set()
         self.spawners = set()
+        self.spawners_order = {}
+        # position -> flags of the items on it (see Board), kept in step with the item sets
+        self.cell_items = {}
+        # walls and spawners as a cell grid, the part of get_observation that never changes
+        self.static_cells = None
+        # read-only views of the sets above handed to the players, dropped whenever a set changes
+        self.frozen_sets = {}
+        # while simulating (see simulation) the players are not told about points, deaths and wins
+        self.simulating = False
+        self.seed = None
+        self.ticks = 0
+        # items spawned in the current tick, position -> name of the set
+        self.spawned = {}
+        self.recorder = None
 
         self.final_scores = {player: 0 for player in self.players}
 
         self.__init_game()
 
     def __init_game(self):
+        board = self.compiled
         ghosts_copy = self.ghosts.copy()
         players_copy = self.players.copy()
+        for start in board.player_starts:
+            player = players_copy.pop()
+            self.starting_positions[player] = board.positions[start]
+        for start in board.ghost_starts:
+            ghost = ghosts_copy.pop()
+            self.starting_positions[ghost] = board.positions[start]
 
-        for y, line in enumerate(self.board):
-            for x, obj in enumerate(line):
-                if obj == 'p':
-                    player = players_copy.pop()
-                    self.positions[player] = Position(x, y)
-                    self.directions[player] = Direction.RIGHT
-                if obj == 'g':
-                    ghost = ghosts_copy.pop()
-                    self.positions[ghost] = Position(x, y)
-                    self.starting_positions[ghost] = Position(x, y)
-                    self.directions[ghost] = Direction.RIGHT
-                if obj == '*':
-                    self.points.add(Position(x, y))
-                if obj == '+':
-                    self.big_points.add(Position(x, y))
-                if obj == 'w':
-                    self.walls.add(Position(x, y))
-                if obj == 'z':
-                    self.phasing_points.add(Position(x, y))
-                if obj == 'i':
-                    self.indestructible_points.add(Position(x, y))
-                if obj == 'd':
-                    self.double_points.add(Position(x, y))
-                if obj == 's':
-                    self.spawners.add(Position(x, y))
-                if obj == 'b':
-                    self.big_big_points.add(Position(x, y))
+        # filled in the order of the board strings, so they iterate like they always did
+        for name, flag in ITEM_TYPES.items():
+            setattr(self, name, set(board.item_positions(flag)))
+        self.spawners = set(board.item_positions(SPAWNER))
+        self.walls = board.walls
 
-        for spawner in self.spawners:
-            self.spawners_timers[spawner] = TIMER_SPAWNER, False
+        self.spawners_order = {spawner: i for i, spawner in enumerate(self.spawners)}
+        for name, flag in ITEM_TYPES.items():
+            for position in getattr(self, name):
+                self.cell_items[position] = self.cell_items.get(position, 0) | flag
 
-        self.board_size = (len(self.board[0]), len(self.board))
+        # what reset() brings the board back to, so the strings are parsed only once
+        self.initial_items = {name: frozenset(getattr(self, name)) for name in RESETTABLE_SETS}
+
+        self.board_size = board.board_size
+
+        self.static_cells = (board.cells & (WALL | SPAWNER)).reshape(board.height, board.width)
 
         if self.display_mode_on:
             pygame.init()
@@ -120,161 +211,399 @@ class Game:
             self.ghost_image = pygame.transform.scale(pygame.image.load('./assets/red_ghost.png'), (30, 30))
             self.ghost_image_blue = pygame.transform.scale(pygame.image.load('./assets/blue_ghost.png'), (30, 30))
 
-    def __draw_board(self):
-        self.screen.fill((0, 0, 0))
+        self.reset()
+
+    """
+    Puts everything back to the start of a game, reusing the parsed board and all the containers.
+    The seed goes to the random module, which the ghosts and the spawners draw from.
+    Returns the GameState of every player.
+    """
+    def reset(self, seed=None):
+        if seed is not None:
+            random.seed(seed)
+        self.seed = seed
+        self.ticks = 0
+        self.stop_recording()
+
+        self.players[:] = self.all_players
+        self.positions.clear()
+        self.directions.clear()
+        for entity in self.players + self.ghosts:
+            self.positions[entity] = self.starting_positions[entity]
+            self.directions[entity] = Direction.RIGHT
+        for ghost in self.ghosts:
+            if ghost.route is not None:
+                ghost.route.clear()
+
+        self.eatable_timers.clear()
+        self.phasing_timers.clear()
+        self.double_points_timers.clear()
+        self.indestructible_timers.clear()
+        self.spawners_timers.clear()
+        self.active_spawners.clear()
+        self.timer_wheel.rebuild()
+        for spawner in self.spawners:
+            # as if set in the tick before the first one
+            self.timer_wheel.schedule(self.spawners_timers, spawner, TIMER_SPAWNER - 1)
 
-        for y, line in enumerate(self.board):
-            for x, obj in enumerate(line):
-                if obj == 'w':
-                    color = (0, 255, 255)
-                    pygame.draw.rect(self.screen, color,
-                                     pygame.Rect(self.cell_size * x, self.cell_size * y, self.cell_size,
-                                                 self.cell_size))
+        for name, initial in self.initial_items.items():
+            if getattr(self, name) != initial:
+                self.replace_items(name, initial)
 
+        self.skip_ghosts = False
+        self.final_scores = {player: 0 for player in self.players}
+        return self.get_game_states()
+
+    """
+    Plays one tick with the moves given from outside instead of asking the players.
+    actions maps every living player to a Direction, an illegal move keeps the player in place.
+    Returns the GameState of every living player, the points every player got in this tick,
+    whether the game is over and some extra info.
+    """
+    def step(self, actions):
+        if self.display_mode_on and not self.simulating and self.__is_frame_due():
+            self.__handle_events()
+            self.__draw_board()
+
+        moves = {player: self.legal_move(player, actions[player]) for player in self.players}
+        points_to_give = self.tick(moves)
+
+        rewards = {player: points_to_give.get(player, 0) if player in self.players else 0
+                   for player in self.all_players}
+        done = not self.players or (not self.points and not self.big_points)
+        if done and not self.simulating:
+            for player in self.players:
+                player.on_win(self.final_scores)
+            self.stop_recording()
+        info = {'alive': self.players.copy(), 'final_scores': self.final_scores.copy()}
+        return self.get_game_states(), rewards, done, info
+
+    """
+    The same (OBSERVATION_CHANNELS, height, width) uint8 grid as HeadlessGame.get_observation.
+    """
+    def get_observation(self, out=None):
+        width, height = self.board_size
+        if out is None:
+            out = np.zeros((OBSERVATION_CHANNELS, height, width), dtype=np.uint8)
+        out[CELLS_CHANNEL] = self.static_cells
+        out[PLAYERS_CHANNEL] = 0
+        out[GHOSTS_CHANNEL] = 0
+        cells = out[CELLS_CHANNEL]
+        for position, items in self.cell_items.items():
+            if items:
+                cells[position.y, position.x] |= items
+        for slot, player in enumerate(self.all_players):
+            if player in self.players:
+                position = self.positions[player]
+                out[PLAYERS_CHANNEL, position.y, position.x] = slot + 1
+        for ghost in self.ghosts:
+            position = self.positions[ghost]
+            out[GHOSTS_CHANNEL, position.y, position.x] = EATABLE_GHOST if ghost in self.eatable_timers else GHOST
+        return out
+
+    """
+    Ticks left of the timers of every player (ordered like all_players) as a (players, PLAYER_TIMERS) array,
+    0 where a timer doesn't run or the player is dead.
+    """
+    def get_timers(self, out=None):
+        if out is None:
+            out = np.zeros((len(self.all_players), PLAYER_TIMERS), dtype=np.int32)
+        out[:] = 0
+        for column, timers in ((EATABLE_TIMER, self.eatable_timers), (PHASING_TIMER, self.phasing_timers),
+                               (DOUBLE_POINTS_TIMER, self.double_points_timers),
+                               (INDESTRUCTIBLE_TIMER, self.indestructible_timers)):
+            for slot, player in enumerate(self.all_players):
+                if player in timers and player in self.players:
+                    out[slot, column] = timers[player] - self.ticks
+        return out
+
+    def legal_move(self, player, move):
+        if can_move_in_direction(self.positions[player], move, self.walls, self.board_size,
+                                 phasing=self.is_stuck(player) or player in self.phasing_timers):
+            return move
+        return None
+
+    def __is_frame_due(self):
+        if not self.players or (not self.points and not self.big_points):
+            return True
+        if self.render_fps is None:
+            return self.ticks % self.render_every == 0
+        now = time.perf_counter()
+        if now < self.next_frame_time:
+            return False
+        self.next_frame_time = now + 1 / self.render_fps
+        return True
+
+    def __handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                exit()
+
+    """
+    Walls are drawn once into the background. A frame only redraws the screen where something changed:
+    the old and new place of every sprite that moved and every cell whose items changed.
+    Each such rect is restored from the background and everything overlapping it is drawn again,
+    clipped to it and in the usual order (players, ghosts, items), then only those rects are updated.
+    """
+    def __draw_board(self):
+        if self.background is None:
+            self.background = self.__draw_background()
+            self.drawn_sprites = {}
+            self.dirty_cells.clear()
+            dirty_rects = [self.screen.get_rect()]
+        else:
+            dirty_rects = []
+
+        sprites = self.__get_sprites()
+        for entity, (rect, image) in self.drawn_sprites.items():
+            if entity not in sprites or sprites[entity] != (rect, image):
+                dirty_rects.append(rect)
+        for entity, (rect, image) in sprites.items():
+            if self.drawn_sprites.get(entity) != (rect, image):
+                dirty_rects.append(rect)
+        for position in self.dirty_cells:
+            dirty_rects.append(pygame.Rect(position.x * self.cell_size, position.y * self.cell_size,
+                                           self.cell_size, self.cell_size))
+        self.dirty_cells.clear()
+
+        for dirty_rect in dirty_rects:
+            self.screen.set_clip(dirty_rect)
+            self.screen.blit(self.background, dirty_rect, dirty_rect)
+            for entity, (rect, image) in sprites.items():
+                if rect.colliderect(dirty_rect):
+                    self.__draw_sprite(entity, rect, image)
+            self.__draw_items(dirty_rect)
+        self.screen.set_clip(None)
+
+        self.drawn_sprites = sprites
+        pygame.display.update(dirty_rects)
+
+    def __draw_background(self):
+        background = pygame.Surface(self.screen.get_size())
+        background.fill((0, 0, 0))
+        color = (0, 255, 255)
+        for wall in self.walls:
+            pygame.draw.rect(background, color,
+                             pygame.Rect(self.cell_size * wall.x, self.cell_size * wall.y, self.cell_size,
+                                         self.cell_size))
+        return background
+
+    def __get_sprites(self):
+        sprites = {}
         for player in self.players:
-            color = self.players_colors[player]
             position = self.positions[player]
-            pygame.draw.rect(self.screen, color,
-                             pygame.Rect(self.cell_size * position.x - self.player_size // 2, self.cell_size * position.y - self.player_size // 2, self.player_size, self.player_size))
-            self.screen.blit(self.player_image,
-                             (position.x * self.cell_size - self.player_size // 2,
-                              position.y * self.cell_size - self.player_size // 2))
-
+            rect = pygame.Rect(self.cell_size * position.x - self.player_size // 2,
+                               self.cell_size * position.y - self.player_size // 2,
+                               self.player_size, self.player_size).union(
+                self.player_image.get_rect(topleft=(position.x * self.cell_size - self.player_size // 2,
+                                                    position.y * self.cell_size - self.player_size // 2)))
+            sprites[player] = rect, self.player_image
         for ghost in self.ghosts:
             position = self.positions[ghost]
-            self.screen.blit(self.ghost_image_blue if ghost in self.eatable_timers else self.ghost_image,
-                             (position.x * self.cell_size - self.player_size // 2,
-                              position.y * self.cell_size - self.player_size // 2))
-
-        color = (255, 255, 255)
-
-        for point in self.points:
-            pygame.draw.ellipse(self.screen, color,
-                                pygame.Rect(point.x * self.cell_size + (self.cell_size - self.point_size) // 2,
-                                            point.y * self.cell_size + (self.cell_size - self.point_size) // 2,
-                                            self.point_size,
-                                            self.point_size))
-        for point in self.big_points:
-            pygame.draw.ellipse(self.screen, color,
-                                pygame.Rect(point.x * self.cell_size + (self.cell_size - self.big_point_size) // 2,
-                                            point.y * self.cell_size + (self.cell_size - self.big_point_size) // 2,
-                                            self.big_point_size,
-                                            self.big_point_size))
-
-        for point in self.phasing_points:
-            pygame.draw.ellipse(self.screen, (255, 0, 255),
-                                pygame.Rect(point.x * self.cell_size + (self.cell_size - self.big_point_size) // 2,
-                                            point.y * self.cell_size + (self.cell_size - self.big_point_size) // 2,
-                                            self.big_point_size,
-                                            self.big_point_size))
-
-        for point in self.double_points:
-            pygame.draw.ellipse(self.screen, (255, 255, 0),
-                                pygame.Rect(point.x * self.cell_size + (self.cell_size - self.big_point_size) // 2,
-                                            point.y * self.cell_size + (self.cell_size - self.big_point_size) // 2,
-                                            self.big_point_size,
-                                            self.big_point_size))
-
-        for point in self.indestructible_points:
-            pygame.draw.ellipse(self.screen, (0, 255, 0),
-                                pygame.Rect(point.x * self.cell_size + (self.cell_size - self.big_point_size) // 2,
-                                            point.y * self.cell_size + (self.cell_size - self.big_point_size) // 2,
-                                            self.big_point_size,
-                                            self.big_point_size))
-
-        for point in self.big_big_points:
-            pygame.draw.ellipse(self.screen, (255, 0, 0),
-                                pygame.Rect(point.x * self.cell_size + (self.cell_size - self.big_big_point_size) // 2,
-                                            point.y * self.cell_size + (self.cell_size - self.big_big_point_size) // 2,
-                                            self.big_big_point_size,
-                                            self.big_big_point_size))
-
-        pygame.display.flip()
+            image = self.ghost_image_blue if ghost in self.eatable_timers else self.ghost_image
+            sprites[ghost] = image.get_rect(topleft=(position.x * self.cell_size - self.player_size // 2,
+                                                     position.y * self.cell_size - self.player_size // 2)), image
+        return sprites
+
+    def __draw_sprite(self, entity, rect, image):
+        if entity in self.players_colors:
+            position = self.positions[entity]
+            pygame.draw.rect(self.screen, self.players_colors[entity],
+                             pygame.Rect(self.cell_size * position.x - self.player_size // 2, self.cell_size * position.y - self.player_size // 2, self.player_size, self.player_size))
+        self.screen.blit(image, rect.topleft)
+
+    def __draw_items(self, rect):
+        item_styles = ((POINT, (255, 255, 255), self.point_size),
+                       (BIG_POINT, (255, 255, 255), self.big_point_size),
+                       (PHASING_POINT, (255, 0, 255), self.big_point_size),
+                       (DOUBLE_POINT, (255, 255, 0), self.big_point_size),
+                       (INDESTRUCTIBLE_POINT, (0, 255, 0), self.big_point_size),
+                       (BIG_BIG_POINT, (255, 0, 0), self.big_big_point_size))
+        width, height = self.board_size
+        for y in range(max(rect.top // self.cell_size, 0), min((rect.bottom - 1) // self.cell_size + 1, height)):
+            for x in range(max(rect.left // self.cell_size, 0), min((rect.right - 1) // self.cell_size + 1, width)):
+                items = self.cell_items.get(Position(x, y), 0)
+                if not items:
+                    continue
+                for flag, color, size in item_styles:
+                    if items & flag:
+                        pygame.draw.ellipse(self.screen, color,
+                                            pygame.Rect(x * self.cell_size + (self.cell_size - size) // 2,
+                                                        y * self.cell_size + (self.cell_size - size) // 2,
+                                                        size, size))
 
     def run(self):
         while True:
-            if self.display_mode_on:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        pygame.quit()
-                        exit()
+            if self.display_mode_on and self.__is_frame_due():
+                self.__handle_events()
                 if self.display_mode_on:
                     self.__draw_board()
 
-                pygame.time.delay(self.delay)
+                if self.render_fps is None:
+                    pygame.time.delay(self.delay)
 
             if not self.players:  # bye
                 print("you lost")
+                self.stop_recording()
                 return self.final_scores
 
             if not self.points and not self.big_points:
                 for player in self.players:
                     player.on_win(self.final_scores)
                 print('you won')  # congrats!
+                self.stop_recording()
                 return self.final_scores
 
-            self.update_eatable_timers()
+            self.tick()
 
-            self.update_phasing_timers()
+    """
+    One time step. Whatever is not given is decided as usual: moves by the players,
+    ghost_directions by the ghosts and spawned (position -> name of the set) by the spawners.
+    """
+    def tick(self, moves=None, ghost_directions=None, spawned=None):
+        if self.recorder is not None and not self.simulating:
+            self.recorder.record_keyframe_if_due(self)
+        self.spawned = {}
 
-            self.update_double_points_timers()
+        expired_spawners = self.update_timers()
 
-            self.update_indestructible_timers()
-
-            self.update_spawners_timers()
+        self.update_spawners_timers(expired_spawners, spawned)
 
+        if moves is None:
             player_info = self.get_player_info()
 
             ghost_info = self.get_ghost_info()
 
             moves = self.get_player_moves(ghost_info, player_info)
 
+        if ghost_directions is None:
             self.update_ghost_movement_directions()
+        else:
+            for ghost, direction in zip(self.ghosts, ghost_directions):
+                self.directions[ghost] = direction
+
+        if self.recorder is not None and not self.simulating:
+            self.recorder.record_tick(self, moves)
 
-            old_positions = self.update_positions_and_get_old(moves)
+        old_positions = self.update_positions_and_get_old(moves)
 
-            points_to_give = {player: 0 for player in self.players}
+        points_to_give = {player: 0 for player in self.players}
 
-            self.handle_players_eating_enemies(old_positions, points_to_give)
+        self.handle_players_eating_enemies(old_positions, points_to_give)
 
-            # ghosts eating players
-            self.handle_ghosts_eating(old_positions)
+        # ghosts eating players
+        self.handle_ghosts_eating(old_positions)
 
-            # eating points
-            self.handle_players_eating_points(points_to_give)
+        # eating points
+        self.handle_players_eating_points(points_to_give)
 
-            for player, points in points_to_give.items():
-                if player in self.players:  # if player is not dead
+        for player, points in points_to_give.items():
+            if player in self.players:  # if player is not dead
+                if not self.simulating:
                     player.give_points(points)
-                    self.final_scores[player] += points
+                self.final_scores[player] += points
+
+        self.ticks += 1
+        return points_to_give
+
+    """
+    Streams the game from now on to a replay file, see Replay.ReplayReader for reading it back.
+    """
+    def record(self, path, keyframe_interval=100):
+        from .Replay import ReplayWriter
+        self.stop_recording()
+        self.recorder = ReplayWriter(path, self, keyframe_interval)
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def snapshot(self) -> GameSnapshot:
+        return GameSnapshot(tuple(self.players), self.positions.copy(), self.directions.copy(),
+                            self.eatable_timers.copy(), self.phasing_timers.copy(),
+                            self.double_points_timers.copy(), self.indestructible_timers.copy(),
+                            self.spawners_timers.copy(), frozenset(self.active_spawners),
+                            {name: self.get_frozen(name) for name in RESETTABLE_SETS},
+                            tuple(ghost.was_eatable for ghost in self.ghosts),
+                            tuple((ghost.route.path, ghost.route.goal, ghost.route.walked)
+                                  if ghost.route is not None else None for ghost in self.ghosts), self.skip_ghosts,
+                            self.final_scores.copy(), random.getstate(), self.ticks)
+
+    def restore(self, snapshot: GameSnapshot):
+        self.players[:] = snapshot.players
+        for current, saved in ((self.positions, snapshot.positions), (self.directions, snapshot.directions),
+                               (self.eatable_timers, snapshot.eatable_timers),
+                               (self.phasing_timers, snapshot.phasing_timers),
+                               (self.double_points_timers, snapshot.double_points_timers),
+                               (self.indestructible_timers, snapshot.indestructible_timers),
+                               (self.spawners_timers, snapshot.spawners_timers)):
+            current.clear()
+            current.update(saved)
+        self.active_spawners.clear()
+        self.active_spawners.update(snapshot.active_spawners)
+        self.rebuild_timer_wheel()
+        for name, items in snapshot.items.items():
+            if self.frozen_sets.get(name) is not items:  # the set changed since the snapshot
+                self.replace_items(name, items)
+                self.frozen_sets[name] = items
+        for ghost, was_eatable, route in zip(self.ghosts, snapshot.ghosts_were_eatable, snapshot.ghost_routes):
+            ghost.was_eatable = was_eatable
+            if route is not None:
+                ghost.route.set(*route)
+        self.skip_ghosts = snapshot.skip_ghosts
+        self.final_scores = snapshot.final_scores.copy()
+        random.setstate(snapshot.rng_state)
+        self.ticks = snapshot.ticks
+
+    """
+    For lookahead: step() the game as much as you like inside, it is restored when you leave.
+    The players don't get any callbacks meanwhile.
+    """
+    @contextmanager
+    def simulation(self):
+        snapshot = self.snapshot()
+        self.simulating = True
+        try:
+            yield self
+        finally:
+            self.simulating = False
+            self.restore(snapshot)
 
     def handle_players_eating_points(self, points_to_give):
         for player in self.players:
-            if self.positions[player] in self.points:
-                self.points.remove(self.positions[player])
+            position = self.positions[player]
+            items = self.cell_items.get(position, 0)
+            if not items:
+                continue
+            if items & POINT:
+                self.remove_item('points', position)
                 points_to_give[
                     player] += POINT_VALUE * 1 if player not in self.double_points_timers else POINT_VALUE * 2
-            if self.positions[player] in self.big_points:
-                self.big_points.remove(self.positions[player])
+            if items & BIG_POINT:
+                self.remove_item('big_points', position)
                 # set timer on other players and ghosts
                 for other_player in self.players:
                     if other_player is not player:
-                        self.eatable_timers[other_player] = TIMER
+                        self.set_timer(self.eatable_timers, other_player)
                 for ghost in self.ghosts:
-                    self.eatable_timers[ghost] = TIMER
+                    self.set_timer(self.eatable_timers, ghost)
                 points_to_give[
                     player] += BIG_POINT_VALUE * 1 if player not in self.double_points_timers else BIG_POINT_VALUE * 2
-            if self.positions[player] in self.phasing_points:
-                self.phasing_points.remove(self.positions[player])
-                self.phasing_timers[player] = TIMER
-            if self.positions[player] in self.double_points:
-                self.double_points.remove(self.positions[player])
-                self.double_points_timers[player] = TIMER
-            if self.positions[player] in self.indestructible_points:
-                self.indestructible_points.remove(self.positions[player])
-                self.indestructible_timers[player] = TIMER
-            if self.positions[player] in self.big_big_points:
-                self.big_big_points.remove(self.positions[player])
+            if items & SPAWNED_ITEMS_MASK:
+                self.spawned_item_eaten(position)
+            if items & PHASING_POINT:
+                self.remove_item('phasing_points', position)
+                self.set_timer(self.phasing_timers, player)
+            if items & DOUBLE_POINT:
+                self.remove_item('double_points', position)
+                self.set_timer(self.double_points_timers, player)
+            if items & INDESTRUCTIBLE_POINT:
+                self.remove_item('indestructible_points', position)
+                self.set_timer(self.indestructible_timers, player)
+            if items & BIG_BIG_POINT:
+                self.remove_item('big_big_points', position)
                 points_to_give[
                     player] += BIG_BIG_POINT_VALUE * 1 if player not in self.double_points_timers else BIG_BIG_POINT_VALUE * 2
 
@@ -282,14 +611,14 @@ class Game:
         for ghost in self.ghosts:
             if ghost in self.eatable_timers:
                 continue
+            caught = set(self.occupancy.colliding(ghost, self.players_order))
+            if not caught:
+                continue
+            # removing players from the list we go through skips the one right after, that's how it always was
             for player in self.players:
                 if player in self.indestructible_timers:
                     continue
-                if self.positions.get(ghost) == self.positions.get(player) or (
-                        self.positions.get(ghost) == old_positions[
-                    player] and  # for the case where a player and ghost
-                        self.positions.get(player) == old_positions[ghost]  # move over each other in the same tick
-                ):
+                if player in caught:
                     self.remove_player(player)
 
     def remove_player(self, player):
@@ -298,12 +627,12 @@ class Game:
             self.players.remove(player)
         self.positions.pop(player, None)
         self.directions.pop(player, None)
-        player.on_death()
+        if not self.simulating:
+            player.on_death()
 
     def handle_players_eating_enemies(self, old_positions, points_to_give):
         players_to_remove = []
-        # handle eating enemies
-        # the time complexity could be improved but I don't care
+        # handle eating enemies, self.occupancy tells who collides with whom
         for player in self.players:
             if player in self.eatable_timers:
                 continue
@@ -316,34 +645,26 @@ class Game:
             self.remove_player(player)
 
     def handle_players_eating_players(self, old_positions, player, players_to_remove, points_to_give):
-        for other_player in self.players:
-            if player is not other_player:
-                if self.positions.get(player) == self.positions.get(other_player) or (
-                        self.positions.get(player) == old_positions[other_player]
-                        and self.positions.get(other_player) == old_positions[player]
-                ):
-                    if other_player in self.eatable_timers and other_player not in self.indestructible_timers:
-                        players_to_remove.append(other_player)
-                        points_to_give[
-                            player] += ENEMY_VALUE * 1 if player not in self.double_points_timers else ENEMY_VALUE * 2
-                    elif player not in self.indestructible_timers:
-                        # don't crash into each other. (^^)
-                        players_to_remove.append(player)
+        for other_player in self.occupancy.colliding(player, self.players_order):
+            if other_player in self.eatable_timers and other_player not in self.indestructible_timers:
+                players_to_remove.append(other_player)
+                points_to_give[
+                    player] += ENEMY_VALUE * 1 if player not in self.double_points_timers else ENEMY_VALUE * 2
+            elif player not in self.indestructible_timers:
+                # don't crash into each other. (^^)
+                players_to_remove.append(player)
 
     def handle_players_eating_ghosts(self, old_positions, player, players_to_remove, points_to_give):
-        for ghost in self.ghosts:
-            if self.positions[player] == self.positions[ghost] or (
-                    self.positions.get(player) == old_positions[ghost]
-                    and self.positions.get(ghost) == old_positions[player]
-            ):
-                if ghost in self.eatable_timers:
-                    self.kill_ghost(ghost, player, points_to_give)
-                else:
-                    players_to_remove.append(player)
+        for ghost in self.occupancy.colliding(player, self.ghosts_order):
+            if ghost in self.eatable_timers:
+                self.kill_ghost(ghost, player, points_to_give)
+            else:
+                players_to_remove.append(player)
 
     def kill_ghost(self, ghost, player, points_to_give):
         self.eatable_timers.pop(ghost)
         self.positions[ghost] = self.starting_positions[ghost]
+        self.occupancy.move(ghost, self.positions[ghost])
         self.directions[ghost] = Direction.RIGHT
         points_to_give[player] += ENEMY_VALUE * 1 if player not in self.double_points_timers else ENEMY_VALUE * 2
 
@@ -358,32 +679,40 @@ class Game:
             if self.skip_ghosts:
                 self.positions[ghost] = direction_to_new_position(self.positions[ghost], self.directions[ghost], self.board_size)
         self.skip_ghosts = not self.skip_ghosts
+        entities = self.players + self.ghosts
+        self.players_order = {player: i for i, player in enumerate(self.players)}
+        self.occupancy = Occupancy(entities, [self.positions[entity] for entity in entities],
+                                   [old_positions[entity] for entity in entities])
         return old_positions
 
     def update_ghost_movement_directions(self):
+        itemgetter = my_itemgetter(*self.players)
         for ghost in self.ghosts:
-            itemgetter = my_itemgetter(*self.players)
             self.directions[ghost] = ghost.make_move(self.positions[ghost], self.directions[ghost], self.walls,
                                                      itemgetter(self.positions), self.board_size,
-                                                     True if ghost in self.eatable_timers else False)
+                                                     True if ghost in self.eatable_timers else False,
+                                                     self.ghost_fields)
+
+    def get_game_state(self, player, ghost_info, player_info):
+        # the item sets are shared by all players as frozen views, only the small info dicts are copied
+        other_players = player_info.copy()
+        you = dict(other_players.pop(player))
+        other_players = [dict(info) for info in other_players.values()]
+        ghosts = [dict(info) for info in ghost_info]
+        return GameState(you, other_players, ghosts, self.get_frozen('points'), self.get_frozen('big_points'),
+                         self.get_frozen('phasing_points'), self.get_frozen('double_points'),
+                         self.get_frozen('indestructible_points'), self.get_frozen('big_big_points'),
+                         self.get_frozen('walls'), self.board_size)
+
+    def get_game_states(self):
+        player_info = self.get_player_info()
+        ghost_info = self.get_ghost_info()
+        return {player: self.get_game_state(player, ghost_info, player_info) for player in self.players}
 
     def get_player_moves(self, ghost_info, player_info):
         moves = {}
         for player in self.players:
-            other_players = player_info.copy()
-            you = other_players.pop(player)
-            other_players = deepcopy(list(other_players.values()))
-            you = deepcopy(you)
-            ghosts = deepcopy(ghost_info)
-            points = deepcopy(self.points)
-            big_points = deepcopy(self.big_points)
-            big_big_points = deepcopy(self.big_big_points)
-            indestructible_points = deepcopy(self.indestructible_points)
-            double_points = deepcopy(self.double_points)
-            phasing_points = deepcopy(self.phasing_points)
-            walls = deepcopy(self.walls)
-            board_size = deepcopy(self.board_size)
-            game_state = GameState(you, other_players, ghosts, points, big_points, phasing_points, double_points, indestructible_points, big_big_points, walls, board_size)
+            game_state = self.get_game_state(player, ghost_info, player_info)
             is_stuck = self.is_stuck(player)
             move = player.make_move(game_state)
             while True:
@@ -396,13 +725,17 @@ class Game:
 
         return moves
 
+    def get_frozen(self, name):
+        frozen = self.frozen_sets.get(name)
+        if frozen is None:
+            frozen = self.frozen_sets[name] = frozenset(getattr(self, name))
+        return frozen
+
+    def set_changed(self, name):
+        self.frozen_sets.pop(name, None)
+
     def is_stuck(self, player):
-        is_stuck = True
-        for direction in Direction:
-            if can_move_in_direction(self.positions[player], direction, self.walls, self.board_size):
-                is_stuck = False
-                break
-        return is_stuck
+        return self.compiled.is_stuck[self.compiled.index(self.positions[player])]
 
     def get_ghost_info(self):
         ghost_info = []
@@ -411,7 +744,7 @@ class Game:
             direction = self.directions[ghost]
             if ghost in self.eatable_timers:
                 is_eatable = True
-                eatable_timer = self.eatable_timers[ghost]
+                eatable_timer = self.eatable_timers[ghost] - self.ticks
             else:
                 is_eatable = False
                 eatable_timer = None
@@ -425,25 +758,25 @@ class Game:
             position = self.positions[player]
             if player in self.eatable_timers:
                 is_eatable = True
-                eatable_timer = self.eatable_timers[player]
+                eatable_timer = self.eatable_timers[player] - self.ticks
             else:
                 is_eatable = False
                 eatable_timer = None
             if player in self.phasing_timers or self.is_stuck(player):
                 is_phasing = True
-                phasing_timer = self.phasing_timers.get(player, 0)
+                phasing_timer = self.phasing_timers[player] - self.ticks if player in self.phasing_timers else 0
             else:
                 is_phasing = False
                 phasing_timer = None
             if player in self.double_points_timers:
                 is_double_points = True
-                double_points_timer = self.double_points_timers.get(player, 0)
+                double_points_timer = self.double_points_timers[player] - self.ticks
             else:
                 is_double_points = False
                 double_points_timer = None
             if player in self.indestructible_timers:
                 is_indestructible = True
-                indestructible_timer = self.indestructible_timers.get(player, 0)
+                indestructible_timer = self.indestructible_timers[player] - self.ticks
             else:
                 is_indestructible = False
                 indestructible_timer = None
@@ -453,67 +786,81 @@ class Game:
                                    'is_indestructible': is_indestructible, 'indestructible_timer': indestructible_timer}
         return player_info
 
-    def update_eatable_timers(self):
-        timers_to_remove = []
-        for entity in self.eatable_timers.keys():
-            self.eatable_timers[entity] -= 1
-            if self.eatable_timers[entity] == 0:
-                timers_to_remove.append(entity)
-        for entity in timers_to_remove:
-            del self.eatable_timers[entity]
-
-    def update_phasing_timers(self):
-        timers_to_remove = []
-        for entity in self.phasing_timers.keys():
-            self.phasing_timers[entity] -= 1
-            if self.phasing_timers[entity] == 0:
-                timers_to_remove.append(entity)
-        for entity in timers_to_remove:
-            del self.phasing_timers[entity]
-
-    def update_double_points_timers(self):
-        timers_to_remove = []
-        for entity in self.double_points_timers.keys():
-            self.double_points_timers[entity] -= 1
-            if self.double_points_timers[entity] == 0:
-                timers_to_remove.append(entity)
-        for entity in timers_to_remove:
-            del self.double_points_timers[entity]
-
-    def update_indestructible_timers(self):
-        timers_to_remove = []
-        for entity in self.indestructible_timers.keys():
-            self.indestructible_timers[entity] -= 1
-            if self.indestructible_timers[entity] == 0:
-                timers_to_remove.append(entity)
-        for entity in timers_to_remove:
-            del self.indestructible_timers[entity]
-
-    def update_spawners_timers(self):
-        for position in self.spawners_timers.keys():
-            timer_value = self.spawners_timers[position]
-            self.spawners_timers[position] = (timer_value[0] - 1, timer_value[1])
-
-            if self.spawners_timers[position][1] and position not in (
-                    self.phasing_points | self.double_points | self.indestructible_points | self.big_big_points):  # if point was eaten
-                self.spawners_timers[position] = TIMER_SPAWNER, False
-
-            if self.spawners_timers[position][0] == 0:
-                if self.spawners_timers[position][1]:
-                    self.remove_point(position)
-                    self.spawners_timers[position] = TIMER_SPAWNER, False
-                else:
-                    random.choice(
-                        [self.phasing_points, self.double_points, self.indestructible_points, self.big_big_points]).add(
-                        position)
-                    self.spawners_timers[position] = TIMER_SPAWNER, True
+    def set_timer(self, timers, entity, duration=TIMER):
+        self.timer_wheel.schedule(timers, entity, self.ticks + duration)
+
+    def rebuild_timer_wheel(self):
+        self.timer_wheel.rebuild(self.eatable_timers, self.phasing_timers, self.double_points_timers,
+                                 self.indestructible_timers, self.spawners_timers)
+
+    """
+    A timer set in tick t for n ticks shows n - 1 in tick t + 1 and is gone in tick t + n,
+    so it is stored as t + n and only the timers stored as the current tick are touched.
+    Returns the spawners whose time has come, in the order of self.spawners.
+    """
+    def update_timers(self):
+        expired_spawners = []
+        for timers, key in self.timer_wheel.pop_expired(self.ticks):
+            if timers is self.spawners_timers:
+                expired_spawners.append(key)
+            else:
+                del timers[key]
+        expired_spawners.sort(key=self.spawners_order.get)
+        return expired_spawners
+
+    def update_spawners_timers(self, expired_spawners, spawned=None):
+        for position in expired_spawners:
+            if position in self.active_spawners:
+                self.remove_point(position)
+            else:
+                name = random.choice(SPAWNABLE_SETS) if spawned is None else spawned[position]
+                self.spawned[position] = name
+                self.add_item(name, position)
+                self.active_spawners.add(position)
+                self.set_timer(self.spawners_timers, position, TIMER_SPAWNER)
+
+    """
+    The spawner restarts in the next tick once its item is eaten.
+    """
+    def spawned_item_eaten(self, position):
+        if position in self.active_spawners:
+            self.active_spawners.remove(position)
+            self.set_timer(self.spawners_timers, position, TIMER_SPAWNER + 1)
 
     def remove_point(self, position):
-        self.spawners_timers[position] = TIMER_SPAWNER, False
-        self.indestructible_points.discard(position)
-        self.indestructible_timers.pop(position, None)
-        self.double_points.discard(position)
-        self.double_points_timers.pop(position, None)
-        self.phasing_points.discard(position)
-        self.phasing_timers.pop(position, None)
-        self.big_big_points.discard(position)
+        self.active_spawners.discard(position)
+        self.set_timer(self.spawners_timers, position, TIMER_SPAWNER)
+        items = self.cell_items.get(position, 0)
+        for name in SPAWNABLE_SETS:
+            if items & ITEM_TYPES[name]:
+                self.remove_item(name, position)
+
+    def add_item(self, name, position):
+        getattr(self, name).add(position)
+        if self.display_mode_on:
+            self.dirty_cells.add(position)
+        self.cell_items[position] = self.cell_items.get(position, 0) | ITEM_TYPES[name]
+        self.set_changed(name)
+
+    def remove_item(self, name, position):
+        getattr(self, name).remove(position)
+        if self.display_mode_on:
+            self.dirty_cells.add(position)
+        self.cell_items[position] &= ~ITEM_TYPES[name]
+        self.set_changed(name)
+
+    """
+    Swaps the whole content of an item set, e.g. for a reset or a restore.
+    """
+    def replace_items(self, name, items):
+        flag = ITEM_TYPES[name]
+        current = getattr(self, name)
+        if self.display_mode_on:
+            self.dirty_cells.update(current ^ set(items))
+        for position in current:
+            self.cell_items[position] &= ~flag
+        current.clear()
+        current.update(items)
+        for position in current:
+            self.cell_items[position] = self.cell_items.get(position, 0) | flag
+        self.set_changed(name)
@@ -1,9 +1,11 @@
 from dataclasses import dataclass
-from typing import List, Dict, Any, Set, Tuple
+from typing import List, Dict, Any, FrozenSet, Tuple
 from .Position import Position
 
 """
 All info you might need, I hope.
+The point sets and walls are frozensets shared with the other players - they are read-only,
+make your own copy if you want to change them. The info dicts are yours.
 """
 
 
@@ -12,13 +14,13 @@ class GameState:
     you: Dict[str, Any]
     other_pacmans: List[Dict[str, Any]]
     ghosts: List[Dict[str, Any]]
-    points: Set[Position]
-    big_points: Set[Position]
-    phasing_points: Set[Position]
-    double_points: Set[Position]
-    indestructible_points: Set[Position]
-    big_big_points: Set[Position]
-    walls: Set[Position]
+    points: FrozenSet[Position]
+    big_points: FrozenSet[Position]
+    phasing_points: FrozenSet[Position]
+    double_points: FrozenSet[Position]
+    indestructible_points: FrozenSet[Position]
+    big_big_points: FrozenSet[Position]
+    walls: FrozenSet[Position]
     board_size: Tuple[int, int]
 
     def __str__(self) -> str:
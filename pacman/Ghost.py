@@ -1,8 +1,14 @@
-from .Helpers import can_move_in_direction, find_path, positions_to_direction, direction_to_new_position
+from inspect import signature
+from weakref import WeakKeyDictionary
+
+from .Helpers import can_move_in_direction, find_path, first_step, positions_to_direction, direction_to_new_position
 from .Direction import Direction
 from .Position import Position, clamp
 from random import choice, random
 
+# walls -> (board size, free positions), see free_positions
+_free_positions = WeakKeyDictionary()
+
 
 def rotate_left(direction):
     return {Direction.UP: Direction.LEFT, Direction.LEFT: Direction.DOWN, Direction.DOWN: Direction.RIGHT, Direction.RIGHT: Direction.UP}[direction]
@@ -29,9 +35,30 @@ def get_distance(pacman, my_position):
     return abs(pacman.x - my_position.x) + abs(pacman.y - my_position.y)
 
 
+"""
+The positions of the board that are not walls, built the way get_any_position always built them, so a random
+pick from them without the ghost's position lands on the same position. Kept per walls set, as the games
+never change their walls.
+"""
+def free_positions(walls, board_size) -> set:
+    cached = _free_positions.get(walls) if isinstance(walls, frozenset) else None
+    if cached is not None and cached[0] == board_size:
+        return cached[1]
+    all_positions = set()
+    for x in range(board_size[0]):
+        for y in range(board_size[1]):
+            all_positions.add(Position(x, y))
+    free = all_positions - walls
+    if isinstance(walls, frozenset):
+        _free_positions[walls] = board_size, free
+    return free
+
+
 def strategy_normal_factory(relative_to_pacman: Position):
     # this strategy will look for the closest Pacman and target them
-    def strategy(my_position, my_direction, walls, pacman_positions, board_size, changed):
+    # fields (GhostFields of the board) replace the path searches by lookups, the chosen direction is the same
+    # route (a Route of a non strict Ghost) keeps the way to the goal between intersections when there are no fields
+    def strategy(my_position, my_direction, walls, pacman_positions, board_size, changed, fields=None, route=None):
         if can_move_in_direction(my_position, my_direction, walls, board_size) \
             and not (can_move_in_direction(my_position, rotate_left(my_direction), walls, board_size) or
                      can_move_in_direction(my_position, rotate_right(my_direction), walls, board_size)):
@@ -48,44 +75,112 @@ def strategy_normal_factory(relative_to_pacman: Position):
             clamped_goal = clamp(closest_pacman + relative_to_pacman, Position(0, 0), Position(board_size[0] - 1, board_size[1] - 1))
             if clamped_goal == my_position:
                 clamped_goal = closest_pacman
-            walls_with_previous_position_blocked = walls.copy()
-            walls_with_previous_position_blocked.add(direction_to_new_position(my_position, ~my_direction, board_size))
-            path = find_path(my_position, clamped_goal, walls_with_previous_position_blocked, board_size)
-            if not path:
-                path = find_path(my_position, closest_pacman, walls_with_previous_position_blocked, board_size)
-            if not path:
-                path = find_path(my_position, closest_pacman, walls, board_size)
-            if not path:
-                while not path:
-                    goal = get_any_position(board_size, my_position, walls)
-                    path = find_path(my_position, goal, walls, board_size)
-            return positions_to_direction(my_position, path[0], board_size)
+            # don't turn back
+            previous_position = direction_to_new_position(my_position, ~my_direction, board_size)
+            if fields is not None:
+                step = fields.first_step
+            else:
+                def step(start, goal, blocked=None):
+                    return first_step(start, goal, walls, board_size, blocked)
+            if route is not None and fields is None:
+                # every plan is a search without the fields, the route saves the ones between intersections
+                next_position = route.follow(my_position, clamped_goal)
+                if next_position is not None and next_position != previous_position:
+                    return positions_to_direction(my_position, next_position, board_size)
+                path = find_path(my_position, clamped_goal, walls, board_size, (previous_position,))
+                route.plan(my_position, path, clamped_goal)
+                next_position = path[0] if path else None
+            else:
+                next_position = step(my_position, clamped_goal, previous_position)
+            if next_position is None:
+                next_position = step(my_position, closest_pacman, previous_position)
+            if next_position is None:
+                next_position = step(my_position, closest_pacman)
+            while next_position is None:
+                goal = get_any_position(board_size, my_position, walls)
+                next_position = step(my_position, goal)
+            return positions_to_direction(my_position, next_position, board_size)
 
     def get_any_position(board_size, my_position, walls):
-        all_positions = set()
-        for x in range(board_size[0]):
-            for y in range(board_size[1]):
-                all_positions.add(Position(x, y))
-        goal = choice(list(all_positions - walls - {my_position}))
-        return goal
+        return choice(list(free_positions(walls, board_size) - {my_position}))
 
     return strategy
 
 
+"""
+The way a ghost planned to its goal: positions from where it was planned, and the goal it was planned for.
+It is followed while the ghost stays on it and the goal moves less than replan_distance from where it was,
+otherwise the ghost plans again. steps (position -> index in path) finds the ghost on it without a search.
+"""
+class Route:
+    def __init__(self, replan_distance=2):
+        self.replan_distance = replan_distance
+        self.set([], None)
+
+    """
+    The next position on the route for a ghost at my_position heading to goal, None if it has to plan again.
+    """
+    def follow(self, my_position, goal):
+        if self.goal is None or get_distance(goal, self.goal) > self.replan_distance:
+            return None
+        walked = self.steps.get(my_position)
+        if walked is None or walked < self.walked:
+            return None
+        self.walked = walked
+        return self.path[walked + 1] if walked + 1 < len(self.path) else None
+
+    def plan(self, my_position, path, goal):
+        self.set([my_position] + path, goal if path else None)
+
+    def set(self, path, goal, walked=0):
+        self.path = path
+        self.goal = goal
+        self.walked = walked
+        self.steps = {position: i for i, position in enumerate(path)}
+
+    def clear(self):
+        self.set([], None)
+
+
 class Ghost:
-    def __init__(self, strategy_normal, strategy_eatable):
+    """
+    strict ghosts plan again at every intersection, the others follow their Route (if their strategy_normal
+    takes one, like the ones of strategy_normal_factory) and so may take other turns than strict ones.
+    With GhostFields planning is a lookup, so the Route is only followed on boards too big for them.
+    """
+    def __init__(self, strategy_normal, strategy_eatable, strict=True, replan_distance=2):
         self.strategy_normal = strategy_normal
         self.strategy_eatable = strategy_eatable
         self.was_eatable = False
+        self.strict = strict
+        self.replan_distance = replan_distance
+        # only strategies that know about GhostFields (like the ones of strategy_normal_factory) get them
+        parameters = signature(strategy_normal).parameters if strategy_normal is not None else {}
+        self.normal_takes_fields = 'fields' in parameters
+        self.route = Route(replan_distance) if not strict and 'route' in parameters else None
+
+    # every copy plans its own route
+    def __copy__(self):
+        ghost = Ghost(self.strategy_normal, self.strategy_eatable, self.strict, self.replan_distance)
+        ghost.was_eatable = self.was_eatable
+        return ghost
 
-    def make_move(self, my_position, my_direction, walls, pacman_positions, board_size, is_eatable):
+    def make_move(self, my_position, my_direction, walls, pacman_positions, board_size, is_eatable, fields=None):
         changed = False
         if is_eatable ^ self.was_eatable:
             changed = True
         self.was_eatable = is_eatable
         if is_eatable:
+            if self.route is not None:
+                self.route.clear()
             return self.strategy_eatable(my_position, my_direction, walls, pacman_positions, board_size, changed)
         else:
+            if self.route is not None:
+                return self.strategy_normal(my_position, my_direction, walls, pacman_positions, board_size, changed,
+                                            fields, self.route)
+            if self.normal_takes_fields:
+                return self.strategy_normal(my_position, my_direction, walls, pacman_positions, board_size, changed,
+                                            fields)
             return self.strategy_normal(my_position, my_direction, walls, pacman_positions, board_size, changed)
 
 
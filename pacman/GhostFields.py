@@ -0,0 +1,56 @@
+from typing import Optional, Set, Tuple
+
+import numpy as np
+
+from .Board import Board, WALL
+from .DistanceTable import DistanceTable, MAX_FREE_CELLS, UNREACHABLE, distance_table
+from .Helpers import first_step
+from .Position import Position
+
+"""
+What the ghosts of a board share instead of running their own BFS: the maze distances of the board
+(a DistanceTable, so the distance field to any goal is one of its rows).
+first_step answers with the step Helpers.first_step would take. The cell a ghost must not go back to
+is only a mask on the neighbours of its position, and the full search is run only in the rare case
+the answer could depend on it - when that cell lies on a shortest way to the goal.
+"""
+
+
+class GhostFields:
+    def __init__(self, table: DistanceTable, walls: Set[Position], board_size: Tuple[int, int]):
+        self.table = table
+        self.walls = walls
+        self.board_size = board_size
+
+    def first_step(self, start: Position, goal: Position, blocked: Position = None) -> Optional[Position]:
+        table = self.table
+        start_index = table.index(start)
+        end = table.closest_free(goal)
+        blocked_index = table.index(blocked) if blocked is not None else -1
+        if start_index < 0 or end < 0 or end == blocked_index:
+            return first_step(start, goal, self.walls, self.board_size, blocked)
+        if end == start_index:
+            return None
+
+        distances = table.distances[end]
+        distance = distances[start_index]
+        if distance == UNREACHABLE:
+            return None
+        for neighbour in table.neighbours[start_index]:
+            if neighbour < 0 or neighbour == blocked_index or distances[neighbour] != distance - 1:
+                continue
+            if blocked_index >= 0 and distances[blocked_index] != UNREACHABLE and \
+                    distances[neighbour] == table.distances[neighbour, blocked_index] + distances[blocked_index]:
+                break  # the way from there may have to go through the blocked cell
+            return table.position(neighbour)
+        # every shortest way starts with (or may need) the blocked cell
+        return first_step(start, goal, self.walls, self.board_size, blocked)
+
+
+"""
+GhostFields of the board, None if it has more than MAX_FREE_CELLS free cells.
+"""
+def ghost_fields(board: Board) -> Optional[GhostFields]:
+    if np.count_nonzero((board.cells & WALL) == 0) > MAX_FREE_CELLS:
+        return None
+    return GhostFields(distance_table(board), board.walls, board.board_size)
@@ -0,0 +1,422 @@
+import random
+from typing import List, Union
+
+import numpy as np
+
+from .Board import Board, POINT, BIG_POINT, BIG_BIG_POINT, PHASING_POINT, DOUBLE_POINT, \
+    INDESTRUCTIBLE_POINT, SPAWNED_ITEMS, SPAWNED_ITEMS_MASK, ITEMS_MASK, compile_board
+from .Direction import Direction
+from .GameState import GameState
+from .GhostFields import ghost_fields
+from .Ghost import Ghost
+from .Occupancy import Occupancy
+from .Pacman import Pacman
+from .TimerWheel import TimerWheel
+from .Game import BIG_POINT_VALUE, BIG_BIG_POINT_VALUE, POINT_VALUE, ENEMY_VALUE, TIMER, TIMER_SPAWNER, \
+    CELLS_CHANNEL, PLAYERS_CHANNEL, GHOSTS_CHANNEL, OBSERVATION_CHANNELS, GHOST, EATABLE_GHOST, \
+    EATABLE_TIMER, PHASING_TIMER, DOUBLE_POINTS_TIMER, INDESTRUCTIBLE_TIMER, PLAYER_TIMERS
+
+"""
+Same rules as Game.run, but without pygame and without Position objects in the hot loop.
+The board is a compiled uint8 grid, entities live in slots (players first, then ghosts)
+and their positions are flat cell indices. Positions are only materialized for GameState
+and for the ghost strategies, which still take Positions.
+Timers are dicts slot -> expiry tick driven by a TimerWheel, like in Game.
+"""
+
+
+class HeadlessGame:
+    def __init__(self, board: Union[List[str], Board], ghosts: List[Ghost], players: List[Pacman]):
+        self.board = compile_board(board)
+        self.board_size = self.board.board_size
+
+        self.players = players
+        self.all_players = players.copy()
+        self.ghosts = ghosts
+
+        self.cells = self.board.cells.copy()
+        self.walls = frozenset(self.board.walls)
+        # frozen item sets for GameState, rebuilt only for the cell types that changed since the last tick
+        self.item_sets = {}
+        self.stale_items = ITEMS_MASK
+
+        if len(players) > len(self.board.player_starts):
+            raise ValueError(f"{len(players)} players on a board with {len(self.board.player_starts)} 'p' cells")
+        if len(ghosts) > len(self.board.ghost_starts):
+            raise ValueError(f"{len(ghosts)} ghosts on a board with {len(self.board.ghost_starts)} 'g' cells")
+
+        # players and ghosts are taken from the end of the list, like in Game
+        self.player_starts = [-1] * len(players)
+        for start, slot in zip(self.board.player_starts, reversed(range(len(players)))):
+            self.player_starts[slot] = start
+        self.ghost_starts = [-1] * len(ghosts)
+        for start, slot in zip(self.board.ghost_starts, reversed(range(len(ghosts)))):
+            self.ghost_starts[slot] = start
+
+        self.ghosts_order = {len(players) + ghost: ghost for ghost in range(len(ghosts))}
+        self.players_order = {}
+        self.occupancy = None
+        self.spawner_slots = {index: k for k, index in enumerate(self.board.spawners)}
+        self.timer_wheel = TimerWheel()
+        # maze distances for the ghosts, None on boards too big for them (see GhostFields)
+        self.ghost_fields = ghost_fields(self.board)
+
+        self.reset()
+
+    def reset(self, seed=None):
+        if seed is not None:
+            random.seed(seed)
+        self.ticks = 0
+
+        self.players[:] = self.all_players
+        self.cells[:] = self.board.cells
+        self.stale_items = ITEMS_MASK
+        self.points_left = int(((self.cells & POINT) != 0).sum() + ((self.cells & BIG_POINT) != 0).sum())
+
+        self.alive = list(range(len(self.all_players)))
+        self.is_alive = [True] * len(self.all_players)
+        self.player_cells = self.player_starts.copy()
+        self.player_eatable = {}
+        self.phasing = {}
+        self.double_points = {}
+        self.indestructible = {}
+
+        self.ghost_cells = self.ghost_starts.copy()
+        self.ghost_directions = [Direction.RIGHT] * len(self.ghosts)
+        self.ghost_eatable = {}
+        for ghost in self.ghosts:
+            if ghost.route is not None:
+                ghost.route.clear()
+
+        self.spawner_timers = {}
+        self.spawner_active = set()
+        self.timer_wheel.rebuild()
+        for k in range(len(self.board.spawners)):
+            self.timer_wheel.schedule(self.spawner_timers, k, TIMER_SPAWNER - 1)
+
+        self.skip_ghosts = False
+        self.final_scores = {player: 0 for player in self.all_players}
+
+    """
+    Plays the game to the end like Game.run, which says how it ended only when verbose
+    (many games run at once in a tournament).
+    """
+    def run(self, verbose=False):
+        while True:
+            if not self.alive:  # bye
+                if verbose:
+                    print("you lost")
+                return self.final_scores
+
+            if not self.points_left:
+                for slot in self.alive:
+                    self.all_players[slot].on_win(self.final_scores)
+                if verbose:
+                    print('you won')  # congrats!
+                return self.final_scores
+
+            self.tick()
+
+    def is_over(self):
+        return not self.alive or not self.points_left
+
+    """
+    Drive the game from outside instead of asking the players for moves.
+    actions holds one Direction per player slot, entries of dead players are ignored.
+    An illegal move (into a wall without phasing) keeps the player in place.
+    Returns the points each slot got in this tick and whether the game is over.
+    """
+    def step(self, actions: List[Direction]):
+        moves = {slot: self.legal_move(slot, actions[slot]) for slot in self.alive}
+        points_to_give = self.tick(moves)
+
+        rewards = [0] * len(self.all_players)
+        for slot, points in points_to_give.items():
+            if self.is_alive[slot]:
+                rewards[slot] = points
+
+        done = self.is_over()
+        if done:
+            for slot in self.alive:
+                self.all_players[slot].on_win(self.final_scores)
+        return rewards, done
+
+    def legal_move(self, slot, move):
+        board = self.board
+        cell = self.player_cells[slot]
+        if move is None or board.is_stuck[cell] or slot in self.phasing or board.legal_moves_list[cell][move.value]:
+            return move
+        return None
+
+    def get_observation(self, out=None):
+        width, height = self.board_size
+        if out is None:
+            out = np.zeros((OBSERVATION_CHANNELS, height, width), dtype=np.uint8)
+        out[CELLS_CHANNEL] = self.cells.reshape(height, width)
+        players, ghosts = out[PLAYERS_CHANNEL].reshape(-1), out[GHOSTS_CHANNEL].reshape(-1)
+        players[:] = 0
+        ghosts[:] = 0
+        for slot in self.alive:
+            players[self.player_cells[slot]] = slot + 1
+        for ghost, cell in enumerate(self.ghost_cells):
+            ghosts[cell] = EATABLE_GHOST if ghost in self.ghost_eatable else GHOST
+        return out
+
+    def get_timers(self, out=None):
+        if out is None:
+            out = np.zeros((len(self.all_players), PLAYER_TIMERS), dtype=np.int32)
+        out[:] = 0
+        for column, timers in ((EATABLE_TIMER, self.player_eatable), (PHASING_TIMER, self.phasing),
+                               (DOUBLE_POINTS_TIMER, self.double_points), (INDESTRUCTIBLE_TIMER, self.indestructible)):
+            for slot, expiry in timers.items():
+                if self.is_alive[slot]:
+                    out[slot, column] = expiry - self.ticks
+        return out
+
+    def tick(self, moves=None):
+        expired_spawners = self.update_timers()
+
+        self.update_spawners_timers(expired_spawners)
+
+        if moves is None:
+            player_info = self.get_player_info()
+
+            ghost_info = self.get_ghost_info()
+
+            moves = self.get_player_moves(ghost_info, player_info)
+
+        self.update_ghost_movement_directions()
+
+        old_player_cells, old_ghost_cells = self.update_positions_and_get_old(moves)
+
+        points_to_give = {slot: 0 for slot in self.alive}
+
+        self.handle_players_eating_enemies(old_player_cells, old_ghost_cells, points_to_give)
+
+        # ghosts eating players
+        self.handle_ghosts_eating(old_player_cells, old_ghost_cells)
+
+        # eating points
+        self.handle_players_eating_points(points_to_give)
+
+        for slot, points in points_to_give.items():
+            if self.is_alive[slot]:  # if player is not dead
+                player = self.all_players[slot]
+                player.give_points(points)
+                self.final_scores[player] += points
+
+        self.ticks += 1
+        return points_to_give
+
+    def set_timer(self, timers, slot, duration=TIMER):
+        self.timer_wheel.schedule(timers, slot, self.ticks + duration)
+
+    def timer(self, timers, slot):
+        return timers[slot] - self.ticks if slot in timers else 0
+
+    def update_timers(self):
+        expired_spawners = []
+        for timers, slot in self.timer_wheel.pop_expired(self.ticks):
+            if timers is self.spawner_timers:
+                expired_spawners.append(slot)
+            else:
+                del timers[slot]
+        expired_spawners.sort()
+        return expired_spawners
+
+    def update_spawners_timers(self, expired_spawners):
+        cells = self.cells
+        for k in expired_spawners:
+            index = self.board.spawners[k]
+            if k in self.spawner_active:
+                self.stale_items |= int(cells[index]) & SPAWNED_ITEMS_MASK
+                cells[index] &= ~SPAWNED_ITEMS_MASK & 0xFF
+                self.spawner_active.remove(k)
+            else:
+                item = random.choice(SPAWNED_ITEMS)
+                self.stale_items |= item
+                cells[index] |= item
+                self.spawner_active.add(k)
+            self.set_timer(self.spawner_timers, k, TIMER_SPAWNER)
+
+    def spawned_item_eaten(self, cell):
+        k = self.spawner_slots.get(cell)
+        if k in self.spawner_active:
+            self.spawner_active.remove(k)
+            self.set_timer(self.spawner_timers, k, TIMER_SPAWNER + 1)
+
+    def get_player_info(self):
+        positions = self.board.positions
+        player_info = {}
+        for slot in self.alive:
+            cell = self.player_cells[slot]
+            eatable = self.timer(self.player_eatable, slot)
+            phasing = self.timer(self.phasing, slot)
+            double_points = self.timer(self.double_points, slot)
+            indestructible = self.timer(self.indestructible, slot)
+            is_phasing = bool(phasing) or self.board.is_stuck[cell]
+            player_info[slot] = {'position': positions[cell],
+                                 'is_eatable': bool(eatable), 'eatable_timer': eatable or None,
+                                 'is_phasing': is_phasing, 'phasing_timer': phasing if is_phasing else None,
+                                 'is_double_points': bool(double_points),
+                                 'double_points_timer': double_points or None,
+                                 'is_indestructible': bool(indestructible),
+                                 'indestructible_timer': indestructible or None}
+        return player_info
+
+    def get_ghost_info(self):
+        positions = self.board.positions
+        ghost_info = []
+        for slot in range(len(self.ghosts)):
+            eatable = self.timer(self.ghost_eatable, slot)
+            ghost_info.append({'position': positions[self.ghost_cells[slot]], 'is_eatable': bool(eatable),
+                               'eatable_timer': eatable or None, 'direction': self.ghost_directions[slot]})
+        return ghost_info
+
+    def get_item_sets(self):
+        if self.stale_items:
+            for cell_type in (POINT, BIG_POINT, PHASING_POINT, DOUBLE_POINT, INDESTRUCTIBLE_POINT, BIG_BIG_POINT):
+                if self.stale_items & cell_type or cell_type not in self.item_sets:
+                    self.item_sets[cell_type] = frozenset(self.board.positions_of(self.cells, cell_type))
+            self.stale_items = 0
+        return self.item_sets
+
+    def get_game_state(self, slot, ghost_info, player_info):
+        other_players = [dict(info) for other, info in player_info.items() if other != slot]
+        you = dict(player_info[slot])
+        ghosts = [dict(info) for info in ghost_info]
+        item_sets = self.get_item_sets()
+        return GameState(you, other_players, ghosts, item_sets[POINT], item_sets[BIG_POINT],
+                         item_sets[PHASING_POINT], item_sets[DOUBLE_POINT], item_sets[INDESTRUCTIBLE_POINT],
+                         item_sets[BIG_BIG_POINT], self.walls, self.board_size)
+
+    def get_player_moves(self, ghost_info, player_info):
+        board = self.board
+        moves = {}
+        for slot in self.alive:
+            player = self.all_players[slot]
+            cell = self.player_cells[slot]
+            game_state = self.get_game_state(slot, ghost_info, player_info)
+            phasing = board.is_stuck[cell] or slot in self.phasing
+            move = player.make_move(game_state)
+            # None stays in place, which is always legal (as in Game)
+            while not (phasing or move is None or board.legal_moves_list[cell][move.value]):
+                move = player.make_move(game_state, invalid_move=True)
+            moves[slot] = move
+        return moves
+
+    def update_ghost_movement_directions(self):
+        positions = self.board.positions
+        pacman_positions = tuple(positions[self.player_cells[slot]] for slot in self.alive)
+        for slot, ghost in enumerate(self.ghosts):
+            self.ghost_directions[slot] = ghost.make_move(positions[self.ghost_cells[slot]],
+                                                          self.ghost_directions[slot], self.board.walls,
+                                                          pacman_positions, self.board_size,
+                                                          slot in self.ghost_eatable, self.ghost_fields)
+
+    def update_positions_and_get_old(self, moves):
+        neighbours = self.board.neighbours_list
+        old_player_cells = self.player_cells.copy()
+        for slot in self.alive:
+            if moves[slot] is not None:
+                self.player_cells[slot] = neighbours[self.player_cells[slot]][moves[slot].value]
+        old_ghost_cells = self.ghost_cells.copy()
+        if self.skip_ghosts:
+            for slot, direction in enumerate(self.ghost_directions):
+                self.ghost_cells[slot] = neighbours[self.ghost_cells[slot]][direction.value]
+        self.skip_ghosts = not self.skip_ghosts
+
+        # ghosts are entities len(all_players) + ghost slot in the occupancy
+        self.players_order = {slot: i for i, slot in enumerate(self.alive)}
+        self.occupancy = Occupancy(self.alive + list(self.ghosts_order),
+                                   [self.player_cells[slot] for slot in self.alive] + self.ghost_cells,
+                                   [old_player_cells[slot] for slot in self.alive] + old_ghost_cells)
+        return old_player_cells, old_ghost_cells
+
+    def handle_players_eating_enemies(self, old_player_cells, old_ghost_cells, points_to_give):
+        players_to_remove = []
+        for slot in self.alive:
+            if slot in self.player_eatable:
+                continue
+            # eating ghosts
+            for ghost in self.occupancy.colliding(slot, self.ghosts_order):
+                ghost = self.ghosts_order[ghost]
+                if ghost in self.ghost_eatable:
+                    self.kill_ghost(ghost, slot, points_to_give)
+                else:
+                    players_to_remove.append(slot)
+            # eating players
+            for other in self.occupancy.colliding(slot, self.players_order):
+                if other in self.player_eatable and other not in self.indestructible:
+                    players_to_remove.append(other)
+                    points_to_give[slot] += self.__value(slot, ENEMY_VALUE)
+                elif slot not in self.indestructible:
+                    # don't crash into each other. (^^)
+                    players_to_remove.append(slot)
+
+        for slot in players_to_remove:
+            self.remove_player(slot)
+
+    def handle_ghosts_eating(self, old_player_cells, old_ghost_cells):
+        for entity, ghost in self.ghosts_order.items():
+            if ghost in self.ghost_eatable:
+                continue
+            caught = set(self.occupancy.colliding(entity, self.players_order))
+            if not caught:
+                continue
+            # iterating over the list we remove from, exactly like Game does
+            for slot in self.alive:
+                if slot in self.indestructible:
+                    continue
+                if slot in caught:
+                    self.remove_player(slot)
+
+    def handle_players_eating_points(self, points_to_give):
+        cells = self.cells
+        for slot in self.alive:
+            cell = self.player_cells[slot]
+            items = int(cells[cell])
+            if not items & ITEMS_MASK:
+                continue
+            self.stale_items |= items & ITEMS_MASK
+            if items & POINT:
+                self.points_left -= 1
+                points_to_give[slot] += self.__value(slot, POINT_VALUE)
+            if items & BIG_POINT:
+                self.points_left -= 1
+                # set timer on other players and ghosts
+                for other in self.alive:
+                    if other != slot:
+                        self.set_timer(self.player_eatable, other)
+                for ghost in range(len(self.ghosts)):
+                    self.set_timer(self.ghost_eatable, ghost)
+                points_to_give[slot] += self.__value(slot, BIG_POINT_VALUE)
+            if items & SPAWNED_ITEMS_MASK:
+                self.spawned_item_eaten(cell)
+            if items & PHASING_POINT:
+                self.set_timer(self.phasing, slot)
+            if items & DOUBLE_POINT:
+                self.set_timer(self.double_points, slot)
+            if items & INDESTRUCTIBLE_POINT:
+                self.set_timer(self.indestructible, slot)
+            if items & BIG_BIG_POINT:
+                points_to_give[slot] += self.__value(slot, BIG_BIG_POINT_VALUE)
+            cells[cell] = items & ~ITEMS_MASK
+
+    def kill_ghost(self, ghost, slot, points_to_give):
+        self.ghost_eatable.pop(ghost, None)
+        self.ghost_cells[ghost] = self.ghost_starts[ghost]
+        self.occupancy.move(len(self.all_players) + ghost, self.ghost_cells[ghost])
+        self.ghost_directions[ghost] = Direction.RIGHT
+        points_to_give[slot] += self.__value(slot, ENEMY_VALUE)
+
+    def remove_player(self, slot):
+        self.player_eatable.pop(slot, None)
+        if self.is_alive[slot]:
+            self.alive.remove(slot)
+            self.players.remove(self.all_players[slot])
+            self.is_alive[slot] = False
+        self.all_players[slot].on_death()
+
+    def __value(self, slot, value):
+        return value * 1 if slot not in self.double_points else value * 2
@@ -1,6 +1,6 @@
-from .Position import Position, clamp
+from .Position import Position
 from .Direction import Direction
-from typing import List, Set, Tuple
+from typing import Collection, List, Optional, Set, Tuple
 
 
 def can_move_in_direction(position: Position, direction: Direction, walls: Set[Position],
@@ -49,121 +49,116 @@ def positions_to_direction(start: Position, end: Position, board_size: Tuple[int
         return Direction.RIGHT
 
 
-# get closest position to start that is not a wall
-# get closest position to start that is not a wall
-def get_closest_position(start: Position, walls: Set[Position], board_size: Tuple[int, int]) -> Position:
-    board_width, board_height = board_size
-
-    # create a visited array
-    visited = [[False for _ in range(board_height)] for _ in range(board_width)]
-
-    # create a queue
-    queue = []
-
-    # add the start position to the queue
-    queue.append(start)
-
-    # mark the start position as visited
-    visited[start.x][start.y] = True
-
-    # while the queue is not empty
-    while len(queue) > 0:
-        # get the first element from the queue
-        current = queue.pop(0)
-
-        # if the current position is not a wall
-        if current not in walls and current == clamp(
-                current, Position(0, 0), Position(board_size[0] - 1, board_size[1] - 1)
-        ):
-            # return the current position
-            return current
-
-        # for each direction
-        for direction in Direction:
-            # get the new position
-            new_position = direction_to_new_position(current, direction, board_size)
-
-            # if the new position is not visited
-            if new_position == clamp(
-                    new_position, Position(0, 0), Position(board_size[0] - 1, board_size[1] - 1)) and not \
-            visited[new_position.x][new_position.y]:
-                # add the new position to the queue
-                queue.append(new_position)
-
-                # mark the new position as visited
-                visited[new_position.x][new_position.y] = True
-
-    # return the start position
-    return start
-
-
-# path finding algorithm between two positions on board
-def find_path(start: Position, end: Position, walls: Set[Position], board_size: Tuple[int, int]) -> List[Position]:
-    start = Position(start.x % board_size[0], start.y % board_size[1])
-
-    end = Position(end.x % board_size[0], end.y % board_size[1])
-
-    # get the board size
-    board_width, board_height = board_size
-
-    # create a visited array
-    visited = [[False for _ in range(board_height)] for _ in range(board_width)]
-
-    # create a parent array
-    parent = [[None for _ in range(board_height)] for _ in range(board_width)]
-
-    # create a queue
-    queue = []
-
-    # get the closest position to end that is not a wall
-    end = get_closest_position(end, walls, board_size)
-
-    # add the start position to the queue
-    queue.append(start)
-
-    # mark the start position as visited
-    visited[start.x][start.y] = True
-
-    # while the queue is not empty
-    while len(queue) > 0:
-        # get the first element from the queue
-        current = queue.pop(0)
-
-        # if the current position is the end position
-        if current == end:
-            # create a path
-            path = []
-
-            # while the current position is not the start position
-            while current != start:
-                # add the current position to the path
-                path.append(current)
-
-                # get the parent of the current position
-                current = parent[current.x][current.y]
-
-            # reverse the path
-            path.reverse()
-
-            # return the path
-            return path
-
-        # for each direction
-        for direction in Direction:
-            # get the new position
-            new_position = direction_to_new_position(current, direction, board_size)
-
-            # if the new position is not a wall and is not visited
-            if new_position not in walls and not \
-                    visited[new_position.x][new_position.y]:
-                # add the new position to the queue
-                queue.append(new_position)
-
-                # mark the new position as visited
-                visited[new_position.x][new_position.y] = True
-
-                # set the parent of the new position
-                parent[new_position.x][new_position.y] = current
-
-    # return an empty path
-    return []
+class _Grid:
+    """
+    Neighbour table and BFS scratch buffers of one board size, shared by all the searches on boards of that size.
+    A search marks the cells it visits with its own stamp, so nothing has to be cleared between searches.
+    blocked cells (indices) count as walls on top of the walls set, which is never copied.
+    """
+    def __init__(self, board_size: Tuple[int, int]):
+        self.width, self.height = board_size
+        n_cells = self.width * self.height
+        # only used for looking cells up in the walls set, never handed out
+        self.positions = [Position(index % self.width, index // self.width) for index in range(n_cells)]
+        self.neighbours = []
+        for index in range(n_cells):
+            x, y = index % self.width, index // self.width
+            # in the order of Direction, wrapping around like direction_to_new_position
+            self.neighbours.append((((y - 1) % self.height) * self.width + x,
+                                    ((y + 1) % self.height) * self.width + x,
+                                    y * self.width + (x - 1) % self.width,
+                                    y * self.width + (x + 1) % self.width))
+        self.visited = [0] * n_cells
+        self.parent = [0] * n_cells
+        self.stamp = 0
+
+    def index(self, position: Position) -> int:
+        return (position.y % self.height) * self.width + position.x % self.width
+
+    def closest_free(self, start: int, walls: Set[Position], blocked: Set[int] = frozenset()) -> int:
+        positions = self.positions
+        if positions[start] not in walls and start not in blocked:
+            return start
+        self.stamp += 1
+        stamp, visited, neighbours = self.stamp, self.visited, self.neighbours
+        visited[start] = stamp
+        queue = [start]
+        head = 0
+        while head < len(queue):
+            current = queue[head]
+            head += 1
+            for neighbour in neighbours[current]:
+                if visited[neighbour] != stamp:
+                    visited[neighbour] = stamp
+                    # the first free cell put in the queue is the first free cell taken out of it
+                    if positions[neighbour] not in walls and neighbour not in blocked:
+                        return neighbour
+                    queue.append(neighbour)
+        return start
+
+    def path(self, start: int, end: int, walls: Set[Position], blocked: Set[int] = frozenset()) -> List[int]:
+        if start == end:
+            return []
+        self.stamp += 1
+        stamp, visited, parent, neighbours, positions = \
+            self.stamp, self.visited, self.parent, self.neighbours, self.positions
+        # a blocked cell looks already visited, so the search never enters it
+        for cell in blocked:
+            visited[cell] = stamp
+        visited[start] = stamp
+        queue = [start]
+        head = 0
+        while head < len(queue):
+            current = queue[head]
+            head += 1
+            for neighbour in neighbours[current]:
+                if visited[neighbour] != stamp and positions[neighbour] not in walls:
+                    visited[neighbour] = stamp
+                    parent[neighbour] = current
+                    if neighbour == end:
+                        path = [end]
+                        while parent[path[-1]] != start:
+                            path.append(parent[path[-1]])
+                        path.reverse()
+                        return path
+                    queue.append(neighbour)
+        return []
+
+
+_grids = {}
+
+
+def _grid(board_size: Tuple[int, int]) -> _Grid:
+    board_size = tuple(board_size)
+    grid = _grids.get(board_size)
+    if grid is None:
+        grid = _grids[board_size] = _Grid(board_size)
+    return grid
+
+
+# get closest position to start that is not a wall (nor blocked)
+def get_closest_position(start: Position, walls: Set[Position], board_size: Tuple[int, int],
+                         blocked: Collection[Position] = ()) -> Position:
+    grid = _grid(board_size)
+    start_index = grid.index(start)
+    closest = grid.closest_free(start_index, walls, {grid.index(position) for position in blocked})
+    if closest == start_index and grid.positions[closest] == start:
+        return start
+    return Position(closest % grid.width, closest // grid.width)
+
+
+# path finding algorithm between two positions on board, the blocked positions count as walls
+def find_path(start: Position, end: Position, walls: Set[Position], board_size: Tuple[int, int],
+              blocked: Collection[Position] = ()) -> List[Position]:
+    grid = _grid(board_size)
+    blocked = {grid.index(position) for position in blocked}
+    end = grid.closest_free(grid.index(end), walls, blocked)
+    return [Position(index % grid.width, index // grid.width)
+            for index in grid.path(grid.index(start), end, walls, blocked)]
+
+
+# first position on the path from start to end, the cell blocked (if any) counts as a wall
+def first_step(start: Position, end: Position, walls: Set[Position], board_size: Tuple[int, int],
+               blocked: Position = None) -> Optional[Position]:
+    path = find_path(start, end, walls, board_size, (blocked,) if blocked is not None else ())
+    return path[0] if path else None
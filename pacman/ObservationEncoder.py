@@ -0,0 +1,131 @@
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from .Board import Board, WALL, POINT, BIG_POINT, BIG_BIG_POINT, PHASING_POINT, DOUBLE_POINT, \
+    INDESTRUCTIBLE_POINT, SPAWNER, compile_board
+from .Game import CELLS_CHANNEL, PLAYERS_CHANNEL, GHOSTS_CHANNEL, GHOST, EATABLE_GHOST, PLAYER_TIMERS, TIMER
+
+"""
+Turns the compact observation of get_observation (cell flags, player slots, ghosts) and the timers of
+get_timers into what a network takes: one (PLANES, height, width) float32 stack of 0/1 planes per seat,
+seen from that seat (self and other pacmans are separate planes), and a flat vector of FEATURES per seat.
+Works on a batch of games: the observations of VectorEnv (games, channels, height, width) with its timers,
+or a single game - e.g. encode(game.get_observation(), game.get_timers()) for a Game or HeadlessGame.
+The planes are kept between calls and only the cells that differ from the previous observation are
+written again, which between two ticks are the few cells the players, ghosts and eaten items were on.
+"""
+
+# plane of every cell flag, then the ghosts and the players
+CELL_PLANES = [WALL, POINT, BIG_POINT, BIG_BIG_POINT, PHASING_POINT, DOUBLE_POINT, INDESTRUCTIBLE_POINT, SPAWNER]
+GHOST_PLANE = len(CELL_PLANES)
+EATABLE_GHOST_PLANE = GHOST_PLANE + 1
+SELF_PLANE = GHOST_PLANE + 2
+OTHERS_PLANE = GHOST_PLANE + 3
+# the timers of the seat (see Game.get_timers) as planes filled with the share of the timer left
+TIMER_PLANES = GHOST_PLANE + 4
+PLANES = TIMER_PLANES + PLAYER_TIMERS
+
+# the flat vector: alive, position, timers, share of other pacmans alive, of points left and of eatable ghosts
+ALIVE_FEATURE = 0
+X_FEATURE = 1
+Y_FEATURE = 2
+TIMER_FEATURES = 3
+OTHERS_ALIVE_FEATURE = TIMER_FEATURES + PLAYER_TIMERS
+POINTS_LEFT_FEATURE = OTHERS_ALIVE_FEATURE + 1
+BIG_POINTS_LEFT_FEATURE = POINTS_LEFT_FEATURE + 1
+EATABLE_GHOSTS_FEATURE = BIG_POINTS_LEFT_FEATURE + 1
+FEATURES = EATABLE_GHOSTS_FEATURE + 1
+
+
+class ObservationEncoder:
+    def __init__(self, board: Union[List[str], Board], n_players: int, n_games: int = 1):
+        board = compile_board(board)
+        self.width, self.height = board.board_size
+        self.n_players = n_players
+        self.n_games = n_games
+        n_cells = self.width * self.height
+
+        self.planes = np.zeros((n_games, n_players, PLANES, n_cells), dtype=np.float32)
+        self.features = np.zeros((n_games, n_players, FEATURES), dtype=np.float32)
+        # what the planes show, to find the cells that changed
+        self.previous = None
+        self.previous_timers = np.zeros((n_games, n_players, PLAYER_TIMERS), dtype=np.int32)
+        # cells holding each CELL_PLANES flag, counted as the cells change, and at the start of a game
+        self.counts = np.zeros((n_games, len(CELL_PLANES)), dtype=np.int64)
+        self.initial_counts = np.array([max(np.count_nonzero(board.cells & flag), 1) for flag in CELL_PLANES])
+        self.seats = np.arange(1, n_players + 1)
+
+    """
+    observation as from get_observation and timers as from get_timers, for one game or with the game as the
+    first axis. Returns planes (players, PLANES, height, width) and features (players, FEATURES),
+    with the game axis in front if it was given. Both are views of buffers the next call writes again.
+    """
+    def encode(self, observation: np.ndarray, timers: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        single = observation.ndim == 3
+        observation = observation.reshape(self.n_games, -1, self.width * self.height)
+        timers = timers.reshape(self.n_games, self.n_players, PLAYER_TIMERS)
+        cells = observation[:, CELLS_CHANNEL]
+        players = observation[:, PLAYERS_CHANNEL]
+        ghosts = observation[:, GHOSTS_CHANNEL]
+
+        if self.previous is None:
+            games, changed = np.nonzero(np.ones(cells.shape, dtype=bool))
+            old_cells = np.zeros(len(changed), dtype=cells.dtype)
+            self.previous = observation.copy()
+            self.previous_timers[:] = -1
+        else:
+            games, changed = np.nonzero((observation != self.previous).any(axis=1))
+            old_cells = self.previous[games, CELLS_CHANNEL, changed]
+            self.previous[games, :, changed] = observation[games, :, changed]
+
+        new_cells = cells[games, changed]
+        for plane, flag in enumerate(CELL_PLANES):
+            has = (new_cells & flag) != 0
+            self.planes[games, :, plane, changed] = has[:, None]
+            np.add.at(self.counts[:, plane], games, has.astype(np.int64) - ((old_cells & flag) != 0))
+        ghost = ghosts[games, changed]
+        self.planes[games, :, GHOST_PLANE, changed] = (ghost == GHOST)[:, None]
+        self.planes[games, :, EATABLE_GHOST_PLANE, changed] = (ghost == EATABLE_GHOST)[:, None]
+        player = players[games, changed][:, None]
+        self.planes[games, :, SELF_PLANE, changed] = player == self.seats
+        self.planes[games, :, OTHERS_PLANE, changed] = (player > 0) & (player != self.seats)
+
+        games, seats, timer = np.nonzero(timers != self.previous_timers)
+        if len(games):
+            self.planes[games, seats, TIMER_PLANES + timer] = (timers[games, seats, timer] / TIMER)[:, None]
+            self.previous_timers[:] = timers
+
+        self.__update_features(players, ghosts, timers)
+
+        planes = self.planes.reshape(self.n_games, self.n_players, PLANES, self.height, self.width)
+        if single:
+            return planes[0], self.features[0]
+        return planes, self.features
+
+    def __update_features(self, players, ghosts, timers):
+        features = self.features
+        features[:] = 0
+        games, cells = np.nonzero(players)
+        seats = players[games, cells].astype(np.int64) - 1
+        features[games, seats, ALIVE_FEATURE] = 1
+        features[games, seats, X_FEATURE] = (cells % self.width) / max(self.width - 1, 1)
+        features[games, seats, Y_FEATURE] = (cells // self.width) / max(self.height - 1, 1)
+        features[:, :, TIMER_FEATURES:TIMER_FEATURES + PLAYER_TIMERS] = timers / TIMER
+
+        alive = features[:, :, ALIVE_FEATURE].sum(axis=1, keepdims=True)
+        features[:, :, OTHERS_ALIVE_FEATURE] = (alive - features[:, :, ALIVE_FEATURE]) / max(self.n_players - 1, 1)
+        points_left = self.counts / self.initial_counts
+        features[:, :, POINTS_LEFT_FEATURE] = points_left[:, CELL_PLANES.index(POINT), None]
+        features[:, :, BIG_POINTS_LEFT_FEATURE] = points_left[:, CELL_PLANES.index(BIG_POINT), None]
+        n_ghosts = np.count_nonzero(ghosts, axis=1)
+        eatable = np.count_nonzero(ghosts == EATABLE_GHOST, axis=1) / np.maximum(n_ghosts, 1)
+        features[:, :, EATABLE_GHOSTS_FEATURE] = eatable[:, None]
+        features[features[:, :, ALIVE_FEATURE] == 0] = 0
+
+    """
+    Forget the previous observation, e.g. when the encoder is used for games other than the last ones.
+    """
+    def reset(self):
+        self.previous = None
+        self.counts[:] = 0
@@ -0,0 +1,40 @@
+from typing import Dict, Hashable, Iterable, List
+
+"""
+Who is where in this tick: cell -> entities standing on it and (from, to) -> entities that made that move.
+Two entities collide when they stand on the same cell or walk over each other in the same tick,
+so finding everything that collides with one entity is two dict lookups instead of a loop over all of them.
+Works with anything hashable as an entity and as a position (Game uses objects and Positions,
+HeadlessGame uses slots and cell indices).
+"""
+
+
+class Occupancy:
+    def __init__(self, entities: Iterable[Hashable], positions: Iterable[Hashable], old_positions: Iterable[Hashable]):
+        self.positions = {}
+        self.old_positions = {}
+        self.cells = {}
+        self.crossings = {}
+        for entity, position, old_position in zip(entities, positions, old_positions):
+            self.old_positions[entity] = old_position
+            self.__add(entity, position)
+
+    def __add(self, entity, position):
+        self.positions[entity] = position
+        self.cells.setdefault(position, []).append(entity)
+        self.crossings.setdefault((self.old_positions[entity], position), []).append(entity)
+
+    def move(self, entity, position):
+        # e.g. an eaten ghost sent back to its starting position in the middle of the tick
+        old_position = self.positions[entity]
+        self.cells[old_position].remove(entity)
+        self.crossings[(self.old_positions[entity], old_position)].remove(entity)
+        self.__add(entity, position)
+
+    """
+    Entities from order that collide with entity, sorted by their value in order.
+    """
+    def colliding(self, entity, order: Dict[Hashable, int]) -> List[Hashable]:
+        position = self.positions[entity]
+        found = self.cells.get(position, []) + self.crossings.get((position, self.old_positions[entity]), [])
+        return sorted({other for other in found if other in order and other != entity}, key=order.get)
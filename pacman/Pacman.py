@@ -59,3 +59,21 @@ class RandomPacman(Pacman):
 
     def make_move(self, game_state, invalid_move=False) -> Direction:
         return random.choice(list(Direction))  # it will make some valid move at some point
+
+
+"""
+A seat for a pacman driven from outside the game, e.g. by an RL loop through step().
+Nobody asks it for moves, so it has nothing to decide.
+"""
+class ExternalPacman(Pacman):
+    def give_points(self, points):
+        pass
+
+    def on_death(self):
+        pass
+
+    def on_win(self, result: Dict["Pacman", int]):
+        pass
+
+    def make_move(self, game_state, invalid_move=False) -> Direction:
+        raise RuntimeError("moves of an ExternalPacman are passed to step()")
@@ -0,0 +1,235 @@
+import struct
+from bisect import bisect_right
+from typing import List
+
+import numpy as np
+
+from .Board import board_hash
+from .Direction import Direction
+from .Game import Game, RESETTABLE_SETS, SPAWNABLE_SETS
+from .Ghost import Ghost
+from .Pacman import ExternalPacman
+from .Position import Position
+
+"""
+Replay file layout (little endian):
+    header   - magic, version, seed (-1 if none), board hash, number of players, ghosts and the keyframe interval
+    keyframe - KEYFRAME, tick, payload size, payload (the full state before that tick, see encode_keyframe)
+    tick     - TICK, one byte per player (direction, STAY or DEAD), one byte per ghost (direction),
+               number of spawns and (spawner, item) for every spawn
+A keyframe is written before the first tick and then every keyframe_interval ticks.
+The log keeps every decision made in a tick, so replaying needs neither the agents nor the random state.
+"""
+
+MAGIC = b'PACR'
+VERSION = 1
+HEADER = struct.Struct('<4sBq16sBBH')
+KEYFRAME_HEADER = struct.Struct('<II')
+SPAWN = struct.Struct('<HB')
+
+TICK = 1
+KEYFRAME = 2
+
+STAY = 4
+DEAD = 255
+
+DIRECTIONS = list(Direction)
+
+
+def encode_keyframe(game: Game) -> bytes:
+    width = game.board_size[0]
+
+    def cell(position):
+        return position.y * width + position.x
+
+    def timer(timers, key):
+        # the value the timer had before this tick counted it down
+        return timers[key] - game.ticks + 1 if key in timers else 0
+
+    players = game.all_players
+    alive = [player in game.players for player in players]
+    positions = [cell(game.positions[player]) if is_alive else 0xFFFF for player, is_alive in zip(players, alive)]
+    positions += [cell(game.positions[ghost]) for ghost in game.ghosts]
+    timers = [timer(game.eatable_timers, entity) for entity in players + game.ghosts]
+    for player_timers in (game.phasing_timers, game.double_points_timers, game.indestructible_timers):
+        timers += [timer(player_timers, player) for player in players]
+    spawners = [value for spawner in game.spawners_timers
+                for value in (timer(game.spawners_timers, spawner), spawner in game.active_spawners)]
+    scores = [game.final_scores[player] for player in players]
+
+    chunks = [np.array(alive + [game.skip_ghosts], dtype=np.uint8),
+              np.array(positions, dtype=np.uint16),
+              np.array([game.directions[ghost].value for ghost in game.ghosts], dtype=np.uint8),
+              np.array(timers, dtype=np.uint8),
+              np.array(spawners, dtype=np.uint8),
+              np.array(scores, dtype=np.int32)]
+    for name in RESETTABLE_SETS:
+        items = [cell(position) for position in getattr(game, name)]
+        chunks.append(np.array([len(items)] + items, dtype=np.uint16))
+    return b''.join(chunk.tobytes() for chunk in chunks)
+
+
+def decode_keyframe(game: Game, payload: bytes):
+    width = game.board_size[0]
+    players, ghosts = game.all_players, game.ghosts
+    n_players, n_ghosts, n_spawners = len(players), len(ghosts), len(game.spawners_timers)
+    ticks = game.ticks
+    offset = 0
+
+    def take(dtype, count):
+        nonlocal offset
+        chunk = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += chunk.nbytes
+        return chunk.tolist()
+
+    def position(cell):
+        return Position(cell % width, cell // width)
+
+    flags = take(np.uint8, n_players + 1)
+    positions = take(np.uint16, n_players + n_ghosts)
+    directions = take(np.uint8, n_ghosts)
+    timers = take(np.uint8, 4 * n_players + n_ghosts)
+    spawners = take(np.uint8, 2 * n_spawners)
+    scores = take(np.int32, n_players)
+
+    game.players[:] = [player for player, is_alive in zip(players, flags) if is_alive]
+    game.skip_ghosts = bool(flags[-1])
+    game.positions.clear()
+    game.directions.clear()
+    for player, cell in zip(players, positions):
+        if player in game.players:
+            game.positions[player] = position(cell)
+            game.directions[player] = Direction.RIGHT
+    for ghost, cell, direction in zip(ghosts, positions[n_players:], directions):
+        game.positions[ghost] = position(cell)
+        game.directions[ghost] = DIRECTIONS[direction]
+
+    game.eatable_timers.clear()
+    for entity, timer in zip(players + ghosts, timers):
+        if timer and entity in game.positions:
+            game.eatable_timers[entity] = ticks + timer - 1
+    rest = timers[n_players + n_ghosts:]
+    for k, player_timers in enumerate((game.phasing_timers, game.double_points_timers, game.indestructible_timers)):
+        player_timers.clear()
+        for player, timer in zip(players, rest[k * n_players:(k + 1) * n_players]):
+            if timer:
+                player_timers[player] = ticks + timer - 1
+
+    game.final_scores = dict(zip(players, scores))
+
+    for name in RESETTABLE_SETS:
+        count = take(np.uint16, 1)[0]
+        game.replace_items(name, [position(cell) for cell in take(np.uint16, count)])
+
+    game.active_spawners.clear()
+    for k, spawner in enumerate(game.spawners_timers):
+        timer, active = spawners[2 * k], spawners[2 * k + 1]
+        game.spawners_timers[spawner] = ticks + timer - 1
+        if active:
+            game.active_spawners.add(spawner)
+    game.rebuild_timer_wheel()
+
+
+class ReplayWriter:
+    def __init__(self, path, game: Game, keyframe_interval=100):
+        self.file = open(path, 'wb', buffering=1 << 16)
+        self.keyframe_interval = keyframe_interval
+        self.spawners = {spawner: k for k, spawner in enumerate(game.spawners_timers)}
+        self.first_tick = game.ticks
+        seed = game.seed if game.seed is not None else -1
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, board_hash(game.board), len(game.all_players),
+                                    len(game.ghosts), keyframe_interval))
+
+    def record_keyframe_if_due(self, game: Game):
+        if (game.ticks - self.first_tick) % self.keyframe_interval == 0:
+            payload = encode_keyframe(game)
+            self.file.write(bytes((KEYFRAME,)) + KEYFRAME_HEADER.pack(game.ticks, len(payload)) + payload)
+
+    def record_tick(self, game: Game, moves):
+        record = bytearray((TICK,))
+        for player in game.all_players:
+            if player not in moves:
+                record.append(DEAD)
+            else:
+                record.append(STAY if moves[player] is None else moves[player].value)
+        record.extend(game.directions[ghost].value for ghost in game.ghosts)
+        record.append(len(game.spawned))
+        for position, name in game.spawned.items():
+            record += SPAWN.pack(self.spawners[position], SPAWNABLE_SETS.index(name))
+        self.file.write(record)
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayReader:
+    def __init__(self, path, board: List[str]):
+        with open(path, 'rb') as file:
+            self.data = file.read()
+        magic, version, seed, recorded_hash, n_players, n_ghosts, self.keyframe_interval = \
+            HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a replay file")
+        if recorded_hash != board_hash(board):
+            raise ValueError(f"{path} was recorded on a different board")
+        self.seed = None if seed == -1 else seed
+
+        # a ghost of the replay never decides anything, its moves come from the log
+        self.game = Game(board, [Ghost(None, None) for _ in range(n_ghosts)],
+                         [ExternalPacman() for _ in range(n_players)])
+        self.spawners = list(self.game.spawners_timers)
+
+        self.first_tick = None
+        self.tick_offsets = []
+        self.keyframe_ticks = []
+        self.keyframe_offsets = []
+        offset = HEADER.size
+        tick_size = 1 + n_players + n_ghosts
+        while offset < len(self.data):
+            if self.data[offset] == KEYFRAME:
+                tick, size = KEYFRAME_HEADER.unpack_from(self.data, offset + 1)
+                if self.first_tick is None:
+                    self.first_tick = tick
+                self.keyframe_ticks.append(tick)
+                offset += 1 + KEYFRAME_HEADER.size
+                self.keyframe_offsets.append(offset)
+                offset += size
+            else:
+                self.tick_offsets.append(offset)
+                offset += tick_size + 1 + SPAWN.size * self.data[offset + tick_size]
+
+    @property
+    def n_ticks(self):
+        return len(self.tick_offsets)
+
+    """
+    Brings the game to the state after the given number of recorded ticks and returns it:
+    restores the closest keyframe before it and plays the logged ticks from there.
+    """
+    def seek(self, tick) -> Game:
+        if not 0 <= tick <= self.n_ticks:
+            raise IndexError(f"the replay has {self.n_ticks} ticks")
+        k = bisect_right(self.keyframe_ticks, self.first_tick + tick) - 1
+        self.game.ticks = self.keyframe_ticks[k]
+        decode_keyframe(self.game, self.data[self.keyframe_offsets[k]:])
+        for i in range(self.keyframe_ticks[k] - self.first_tick, tick):
+            self.play_tick(i)
+        return self.game
+
+    def play_tick(self, i):
+        game = self.game
+        offset = self.tick_offsets[i] + 1
+        n_players, n_ghosts = len(game.all_players), len(game.ghosts)
+        moves = {}
+        for player, move in zip(game.all_players, self.data[offset:offset + n_players]):
+            if move != DEAD:
+                moves[player] = None if move == STAY else DIRECTIONS[move]
+        offset += n_players
+        ghost_directions = [DIRECTIONS[direction] for direction in self.data[offset:offset + n_ghosts]]
+        offset += n_ghosts
+        spawned = {}
+        for _ in range(self.data[offset]):
+            spawner, item = SPAWN.unpack_from(self.data, offset + 1)
+            spawned[self.spawners[spawner]] = SPAWNABLE_SETS[item]
+            offset += SPAWN.size
+        game.tick(moves, ghost_directions, spawned)
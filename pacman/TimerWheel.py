@@ -0,0 +1,35 @@
+from typing import Dict, Hashable, List, Tuple
+
+"""
+Timers stored as the tick they expire in instead of a counter decremented every tick.
+Each timers dict maps key -> expiry tick, and the wheel files the same key under that tick,
+so a tick only looks at the timers that expire in it, however many are running.
+A timer that is set again keeps its old entry in the wheel, which is skipped when its tick comes
+because the dict no longer holds that tick.
+"""
+
+
+class TimerWheel:
+    def __init__(self):
+        self.buckets = {}
+
+    def schedule(self, timers: Dict[Hashable, int], key: Hashable, expiry: int):
+        if timers.get(key) == expiry:
+            return
+        timers[key] = expiry
+        self.buckets.setdefault(expiry, []).append((timers, key))
+
+    """
+    (timers, key) of every timer that expires in tick, in the order they were set. They are left in their dicts.
+    """
+    def pop_expired(self, tick: int) -> List[Tuple[Dict[Hashable, int], Hashable]]:
+        return [(timers, key) for timers, key in self.buckets.pop(tick, ()) if timers.get(key) == tick]
+
+    """
+    Files again everything in the given dicts, e.g. after they were overwritten by a restore.
+    """
+    def rebuild(self, *all_timers: Dict[Hashable, int]):
+        self.buckets.clear()
+        for timers in all_timers:
+            for key, expiry in timers.items():
+                self.buckets.setdefault(expiry, []).append((timers, key))
@@ -0,0 +1,70 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from copy import copy
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from .Board import compile_board
+from .Ghost import Ghosts
+from .HeadlessGame import HeadlessGame
+from .Pacman import Pacman
+
+"""
+Plays many games in parallel, one HeadlessGame per task.
+Agents are passed as factories (e.g. a class or functools.partial) and built inside the workers,
+so nothing live has to be pickled. Every game is seeded from the tournament seed and its number,
+so the results don't depend on which worker plays which game.
+"""
+
+
+def default_ghosts():
+    return [copy(ghost) for ghost in (Ghosts.RED, Ghosts.PINK, Ghosts.BLUE, Ghosts.ORANGE)]
+
+
+_worker_board = None
+
+
+def _init_worker(board):
+    global _worker_board
+    _worker_board = compile_board(board)
+
+
+def play_game(agent_factories: List[Callable[[], Pacman]], ghosts_factory: Callable[[], list], seed: int):
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    pacmans = [factory() for factory in agent_factories]
+    np.random.shuffle(pacmans)
+    game = HeadlessGame(_worker_board, ghosts_factory(), pacmans)
+    end_game = game.run(verbose=False)
+    return [(pacman.__class__.__name__, value) for pacman, value in end_game.items()]
+
+
+def run_tournament(board: List[str], agent_factories: List[Callable[[], Pacman]], n_games: int,
+                   ghosts_factory: Callable[[], list] = default_ghosts, workers: int = None,
+                   seed: int = 0) -> Dict[str, List[int]]:
+    workers = workers or os.cpu_count()
+    results = [None] * n_games
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(board,)) as executor:
+        futures = {executor.submit(play_game, agent_factories, ghosts_factory, seed + i): i for i in range(n_games)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            print(f"Game #{i + 1}", end="\t")
+            for name, value in results[i]:
+                print(f"{name}: {value}", end="\t")
+            print()
+
+    # merged in game order, so the score lists are the same for any number of workers
+    stats = {}
+    for result in results:
+        for name, value in result:
+            stats.setdefault(name, []).append(value)
+    return stats
+
+
+def print_ranking(stats: Dict[str, List[int]]):
+    sorted_stats = dict(sorted(stats.items(), key=lambda x: np.mean(x[1]), reverse=True))
+    for i, (pacman_name, values) in enumerate(sorted_stats.items()):
+        print(f"{i + 1}.\t{pacman_name}\t{values}\t{np.mean(values)}")
@@ -0,0 +1,70 @@
+from copy import copy
+from typing import List, Union
+
+import numpy as np
+
+from .Board import Board, compile_board
+from .Direction import Direction
+from .Ghost import Ghost
+from .HeadlessGame import HeadlessGame, OBSERVATION_CHANNELS, PLAYER_TIMERS
+from .Pacman import ExternalPacman
+
+DIRECTIONS = list(Direction)
+
+"""
+N independent HeadlessGames on one compiled board, stepped in lockstep.
+Every seat of every game is driven by the actions passed to step(), observations,
+rewards and done flags come back stacked with the game index as the first axis.
+A finished game is reset right away: observations, timers and alive are then those of the new game,
+and the final scores, observation and alive flags of the finished one are reported in infos.
+"""
+
+
+class VectorEnv:
+    def __init__(self, board: Union[List[str], Board], ghosts: List[Ghost], n_games: int, n_players: int = None):
+        self.board = compile_board(board)
+        self.n_games = n_games
+        self.n_players = n_players if n_players is not None else len(self.board.player_starts)
+
+        # every game gets its own ghosts - they remember whether they were eatable
+        self.games = [HeadlessGame(self.board, [copy(ghost) for ghost in ghosts],
+                                   [ExternalPacman() for _ in range(self.n_players)])
+                      for _ in range(n_games)]
+
+        width, height = self.board.board_size
+        self.observations = np.zeros((n_games, OBSERVATION_CHANNELS, height, width), dtype=np.uint8)
+        self.rewards = np.zeros((n_games, self.n_players), dtype=np.float32)
+        self.dones = np.zeros(n_games, dtype=bool)
+        self.alive = np.zeros((n_games, self.n_players), dtype=bool)
+        # ticks left of the timers of every player, see HeadlessGame.get_timers
+        self.timers = np.zeros((n_games, self.n_players, PLAYER_TIMERS), dtype=np.int32)
+
+    def reset(self):
+        for i, game in enumerate(self.games):
+            game.reset()
+            game.get_observation(self.observations[i])
+            game.get_timers(self.timers[i])
+            self.alive[i] = game.is_alive
+        self.rewards[:] = 0
+        self.dones[:] = False
+        return self.observations
+
+    """
+    actions is an (n_games, n_players) array of Direction values.
+    Returns observations, rewards, dones and a list of infos. The arrays are reused between calls.
+    """
+    def step(self, actions):
+        infos = [{} for _ in range(self.n_games)]
+        for i, game in enumerate(self.games):
+            rewards, done = game.step([DIRECTIONS[action] for action in actions[i]])
+            self.rewards[i] = rewards
+            self.dones[i] = done
+            if done:
+                infos[i]['final_scores'] = [game.final_scores[player] for player in game.all_players]
+                infos[i]['final_observation'] = game.get_observation()
+                infos[i]['final_alive'] = np.array(game.is_alive)
+                game.reset()
+            self.alive[i] = game.is_alive
+            game.get_observation(self.observations[i])
+            game.get_timers(self.timers[i])
+        return self.observations, self.rewards, self.dones, infos
@@ -0,0 +1,53 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# pacman.Board reads PACMAN_CACHE_DIR when it is imported, so the boards and distance tables
+# the tests compile go to a directory of their own instead of the user's cache
+CACHE_DIR = tempfile.mkdtemp(prefix='pacman-for-rl-tests-')
+os.environ['PACMAN_CACHE_DIR'] = CACHE_DIR
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BOARD_BIG = ["wwwwwwwwwwwwwwwwwwwwwwwwwwww",
+             "wp***********ww***********pw",
+             "w*wwww*wwwww*ww*wwwww*wwww*w",
+             "w+wwww*wwwww*ww*wwwww*wwww+w",
+             "w*wwww*wwwww*ww*wwwww*wwww*w",
+             "w**************************w",
+             "w*wwww*ww*wwwwwwww*ww*wwww*w",
+             "w*wwww*ww*wwwwwwww*ww*wwww*w",
+             "w*****iww****ww****wwd*****w",
+             "wwwwww*wwwww ww wwwww*wwwwww",
+             "wwwwww*wwwww ww wwwww*wwwwww",
+             "wwwwww*ww          ww*wwwwww",
+             "wwwwww*ww www  www ww*wwwwww",
+             "wwwwww*ww wwwggwww ww*wwwwww",
+             "   z  *   www  www   *  z   ",
+             "wwwwww*ww wwwggwww ww*wwwwww",
+             "wwwwww*ww wwwwwwww ww*wwwwww",
+             "wwwwww*ww s      s ww*wwwwww",
+             "wwwwww*ww wwwwwwww ww*wwwwww",
+             "wwwwww*ww wwwwwwww ww*wwwwww",
+             "w*****i******ww******d*****w",
+             "w*wwww*wwwww*ww*wwwww*wwww*w",
+             "w*wwww*wwwww*ww*wwwww*wwww*w",
+             "w+**ww****************ww**+w",
+             "www*ww*ww*wwwwwwww*ww*ww*www",
+             "www*ww*ww*wwwwwwww*ww*ww*www",
+             "w******ww****ww****ww******w",
+             "w*wwwwwwwwww*ww*wwwwwwwwww*w",
+             "w*wwwwwwwwww*ww*wwwwwwwwww*w",
+             "wp************************pw",
+             "wwwwwwwwwwwwwwwwwwwwwwwwwwww"]
+
+
+@pytest.fixture
+def board_big():
+    return BOARD_BIG
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
@@ -0,0 +1,59 @@
+import contextlib
+import io
+import random
+from copy import copy
+
+import numpy as np
+import pytest
+
+from pacman.BenioPacman import BenioPacman
+from pacman.BenioPacmanReflex import BenioPacmanReflex
+from pacman.Game import Game
+from pacman.Ghost import Ghosts
+from pacman.HeadlessGame import HeadlessGame
+from pacman.Pacman import RandomPacman
+
+GHOSTS = [Ghosts.RED, Ghosts.PINK, Ghosts.BLUE, Ghosts.ORANGE]
+
+# the ghost stands on the point BenioPacman goes for, so it answers None (stay in place)
+WAITING_BOARDS = [["wwwwwwwwwww",
+                   "wp * * * gw",
+                   "wwwwwwwwwww"],
+                  ["wwwwwwwww",
+                   "wp* * * w",
+                   "w www w w",
+                   "w * * *gw",
+                   "wwwwwwwww"]]
+
+
+def play(game_class, board, make_player, n_players, n_ghosts, seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    players = [make_player() for _ in range(n_players)]
+    game = game_class(board, [copy(ghost) for ghost in GHOSTS[:n_ghosts]], list(players))
+    with contextlib.redirect_stdout(io.StringIO()):
+        scores = game.run()
+    return [scores[player] for player in players]
+
+
+@pytest.mark.parametrize('make_player', [lambda: RandomPacman(False), lambda: BenioPacmanReflex(False),
+                                         lambda: BenioPacman(False)], ids=['random', 'reflex', 'benio'])
+@pytest.mark.parametrize('seed', range(2))
+def test_same_scores_as_game(board_big, make_player, seed):
+    assert play(HeadlessGame, board_big, make_player, 4, 4, seed) == play(Game, board_big, make_player, 4, 4, seed)
+
+
+@pytest.mark.parametrize('board', WAITING_BOARDS)
+def test_pacman_may_stay(board):
+    assert play(HeadlessGame, board, lambda: BenioPacman(False), 1, 1, 0) == \
+           play(Game, board, lambda: BenioPacman(False), 1, 1, 0)
+
+
+def test_more_players_than_starts():
+    board = ["wwwww",
+             "wp gw",
+             "wwwww"]
+    with pytest.raises(ValueError):
+        HeadlessGame(board, [copy(Ghosts.RED)], [BenioPacman(False), BenioPacman(False)])
+    with pytest.raises(ValueError):
+        HeadlessGame(board, [copy(Ghosts.RED), copy(Ghosts.PINK)], [BenioPacman(False)])
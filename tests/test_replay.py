@@ -0,0 +1,46 @@
+import contextlib
+import io
+from copy import copy
+
+from pacman.Game import Game, RESETTABLE_SETS
+from pacman.Ghost import Ghosts
+from pacman.Pacman import RandomPacman
+from pacman.Replay import ReplayReader
+
+
+def state(game):
+    return ({player: game.positions[player] for player in game.players},
+            {ghost: game.positions[ghost] for ghost in game.ghosts},
+            {name: frozenset(getattr(game, name)) for name in RESETTABLE_SETS},
+            dict(game.final_scores))
+
+
+def test_simulation_is_not_recorded(tmp_path, board_big):
+    path = tmp_path / 'game.bin'
+    with contextlib.redirect_stdout(io.StringIO()):
+        game = Game(board_big, [copy(ghost) for ghost in (Ghosts.RED, Ghosts.PINK, Ghosts.BLUE, Ghosts.ORANGE)],
+                    [RandomPacman() for _ in range(4)])
+        game.reset(3)
+        game.record(path, keyframe_interval=25)
+        states = []
+        while game.players and game.points and len(states) < 200:
+            states.append(state(game))
+            if len(states) % 10 == 0:
+                with game.simulation():
+                    for _ in range(5):
+                        if game.players:
+                            game.tick()
+            game.tick()
+        states.append(state(game))
+        game.stop_recording()
+
+        reader = ReplayReader(path, board_big)
+        assert reader.n_ticks == len(states) - 1
+        for tick, expected in enumerate(states):
+            replayed = reader.seek(tick)
+            players = dict(zip(game.all_players, replayed.all_players))
+            ghosts = dict(zip(game.ghosts, replayed.ghosts))
+            assert state(replayed) == ({players[p]: position for p, position in expected[0].items()},
+                                       {ghosts[g]: position for g, position in expected[1].items()},
+                                       expected[2],
+                                       {players[p]: score for p, score in expected[3].items()})
@@ -4,7 +4,8 @@ import numpy as np
 from pacman.BenioPacmanFunctionValueApproximation import BenioPacmanFunctionValueApproximation
 from pacman.Ghost import Ghosts
 from pacman.Pacman import RandomPacman
-from pacman.Game import Game
+from pacman.Tournament import print_ranking
+from pacman.HeadlessGame import HeadlessGame
 
 class RandomPacman1(RandomPacman):
     def __init__(self, print_status=True) -> None:
@@ -73,16 +74,14 @@ def test(n_games=30):
         print(f"Testing #{i + 1}")
         np.random.shuffle(pacmans)
         new_pacmans = deepcopy(pacmans)
-        game = Game(board_big, GHOSTS, new_pacmans, display_mode_on=False, delay=0)
+        game = HeadlessGame(board_big, GHOSTS, new_pacmans)
         end_game = game.run()
         for pacman, value in end_game.items():
             stats[pacman.__class__.__name__].append(value)
             print(f"{pacman.__class__.__name__}: {value}", end="\t")
         print()
 
-    sorted_stats = dict(sorted(stats.items(), key=lambda x:np.mean(x[1]), reverse=True))
-    for i, (pacman_name, values) in enumerate(sorted_stats.items()):
-        print(f"{i + 1}.\t{pacman_name}\t{values}\t{np.mean(values)}")
+    print_ranking(stats)
 
 if __name__ == "__main__":
     test()
\ No newline at end of file